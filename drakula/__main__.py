@@ -1,110 +1,195 @@
+# imported first, so the measured import time covers everything below
+from .profiling import startup_profile
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from time import perf_counter
+from typing import Optional, Union
+
 import dotenv
 import pygame
-from numpy.random import choice, randint
 from logging import basicConfig as init_basic_logging
 
 from .debug import (
     is_debug_layer_enabled,
     DEBUG_LAYER_STRESSTEST,
     DEBUG_LAYER_LOG_VERBOSE,
+    DEBUG_LAYER_STARTUP_PROFILE,
+    DEBUG_LAYER_FRAME_STATS,
+    get_dev_seed,
 )
 from .logging import logger
-from .db import create_database_facade
+from .db import GameDatabaseFacade
+from .snapshot import create_snapshot_facade, SnapshotDatabaseFacade
+from .savegame import default_savegame_path, save_game
+from .replay import replay_config, fresh_seed, InputRecorder, InputReplayer
+from .pacing import pacing_config, FrameScheduler
+from .world import load_or_generate_world, StartupProgress
 from .character import Character, CharacterInputResult
-from .dracula import DraculaBrain
-from .game import MapScene, GameOverScene, GameOverKind
+from .search import create_brain, brain_kind, SEARCH_BUDGET_NODES
+from .belief import BeliefTracker
+from .engine import GameEngine
+from .game import MapScene, GameOverScene, LoadingScene
 from .renderer import Renderer
 from .scene import Scene
-from .state import GameState, disperse_airports_inplace, AirportStatus
 
-AIRPORT_DISPERSION_STEPS = 4
+startup_profile.record("imports", perf_counter() - startup_profile.origin)
+
 WINDOW_TITLE = "The Hunt for Dracula"
 WINDOW_TITLE_TEMPLATE = WINDOW_TITLE + " - {percent}% destroyed"
 
 
-def main(*args, **kwargs):
-    game = create_database_facade()
-
-    airports = list()
-    for continent in game._continents:
-        airports.extend(game.fetch_random_airports(4, continent))
-
-    logger.info("Dispersing airports...")
-    for _ in range(AIRPORT_DISPERSION_STEPS):
-        disperse_airports_inplace(airports)
-    logger.info("Airport dispersion done!")
-
-    renderer = Renderer((1280, 644))
-
-    pygame.display.set_caption(WINDOW_TITLE)
-    icon = pygame.image.load("vampire.png")
-    pygame.display.set_icon(icon)
-
-    character = Character(randint(len(airports)))
-    state = GameState(airports, character.current_location)
+def main(
+    game: Optional[Union[GameDatabaseFacade, SnapshotDatabaseFacade]] = None,
+    *args,
+    **kwargs,
+):
+    running = True
+    progress = StartupProgress()
+
+    replay = replay_config()
+    replayer = InputReplayer(replay.replay_path, replay.fast) if replay.replay_path else None
+    pacing = pacing_config()
+    # replays keep their own pace
+    scheduler = (
+        FrameScheduler(0, 0) if replayer else FrameScheduler(pacing.fps_cap, pacing.idle_fps)
+    )
+    seed = replayer.seed if replayer else get_dev_seed()
+    if replay.record_path and seed is None:
+        # a recording is only worth something if the world can be generated again
+        seed = fresh_seed()
+
+    # only games on the default airports are resumed, the stresstest brings its own
+    savegame = default_savegame_path() if game is None else None
+    if replayer or replay.record_path:
+        savegame = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The world is generated on a worker while textures and shaders load on this thread
+        world = executor.submit(load_or_generate_world, savegame, game, seed, progress)
+
+        with startup_profile.stage("gl init"):
+            if replayer and replayer.fast:
+                pygame.display.gl_set_attribute(pygame.GL_SWAP_CONTROL, 0)
+            elif pacing.vsync is not None:
+                pygame.display.gl_set_attribute(pygame.GL_SWAP_CONTROL, int(pacing.vsync))
+            renderer = Renderer((1280, 644))
+
+            pygame.display.set_caption(WINDOW_TITLE)
+            icon = pygame.image.load("vampire.png")
+            pygame.display.set_icon(icon)
+
+        loading_scene = LoadingScene(progress)
+        while not world.done():
+            renderer.begin()
+            loading_scene.render(renderer)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                renderer.handle_event(event)
+            renderer.end()
+            scheduler.wait(loading_scene.animating)
+
+        state = world.result()
+        startup_profile.mark("world ready")
+
+    # reproducible games search a fixed amount of positions instead of for a fixed time
+    if replayer:
+        brain, max_nodes = replayer.brain, replayer.max_nodes
+    else:
+        brain, max_nodes = brain_kind(), SEARCH_BUDGET_NODES
+    recorder = (
+        InputRecorder(replay.record_path, seed, state, brain, max_nodes)
+        if replay.record_path
+        else None
+    )
+    if replayer:
+        replayer.check_world(state)
+        renderer.fixed_delta_time = replayer.delta_time
+    input_source = replayer or recorder
+
+    character = Character(state)
     logger.info(f"Dracula starts at {state.airports[state.dracula_location].ident}!")
-    scene: Scene = MapScene(state, character)
+    belief = BeliefTracker(state)
+    scene: Scene = MapScene(state, character, belief)
+
+    # a Dracula thinking in the background would make the turns depend on the frame rate
+    engine = GameEngine(
+        state,
+        create_brain(brain, background=False, max_nodes=max_nodes)
+        if input_source
+        else create_brain(brain),
+        seed,
+    )
+
+    def game_over(previous: Scene) -> Scene:
+        if savegame and os.path.exists(savegame):
+            # a finished game is never resumed, however the process ends
+            os.remove(savegame)
+        return GameOverScene(previous, engine.outcome)
 
-    brain = DraculaBrain()
-
-    running = True
     while running:
         renderer.begin()
 
         scene.render(renderer)
 
-        moves = brain.list_moves(state, state.dracula_location)
+        if engine.poll():
+            belief.update(state)
+            pygame.display.set_caption(
+                WINDOW_TITLE_TEMPLATE.format(percent=engine.destroyed_percent)
+            )
+            if engine.outcome is not None:
+                scene = game_over(scene)
 
-        for event in pygame.event.get():
+        for event in input_source.events() if input_source else pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             if scene.handle_event(event):
                 continue
-            if result := character.handle_input(event, state, scene):
-                if result == CharacterInputResult.Moved:
-                    if state.dracula_location == character.current_location:
-                        scene = GameOverScene(scene, GameOverKind.WIN)
-                        continue
-
-                    state.tick_trap_timer(character)
-                    # TODO: make this less confusing
-                    if not state.dracula_on_trap():
-                        state.states[state.dracula_location].status = AirportStatus.DESTROYED
-                        prev_drakula_location = state.dracula_location
-                        state.states[state.dracula_location].status = AirportStatus.DESTROYED
-                        state.destroyed_airports.add(state.dracula_location)
-                        state.dracula_location = choice(
-                            [x for _, x in moves], 1, p=[p for p, _ in moves]
-                        )[0]
-
-                    logger.info(
-                        f"Dracula moves from {state.airports[prev_drakula_location].ident} to {state.airports[state.dracula_location].ident}"
-                    )
-
-                    if state.dracula_location == character.current_location:
-                        scene = GameOverScene(scene, GameOverKind.LOSS_CAUGHT)
-                        continue
-
-                    percent_of_world_destroyed = round(100 * len(state.destroyed_airports) / len(state.airports))
-                    pygame.display.set_caption(WINDOW_TITLE_TEMPLATE.format(percent=percent_of_world_destroyed))
-
-                    if percent_of_world_destroyed > 50:
-                        scene = GameOverScene(scene, GameOverKind.LOSS_DESTROYED)
-                        continue
+            if character.handle_input(event, engine) == CharacterInputResult.Moved:
+                if not engine.thinking:
+                    belief.update(state)
+                pygame.display.set_caption(
+                    WINDOW_TITLE_TEMPLATE.format(percent=engine.destroyed_percent)
+                )
+                if engine.outcome is not None:
+                    scene = game_over(scene)
+                    continue
 
             if renderer.handle_event(event):
                 continue
 
         renderer.end()
+        if not startup_profile.reported:
+            startup_profile.mark("first game frame")
+            startup_profile.report()
+        # the move of a Dracula thinking in the background is polled for every frame
+        scheduler.wait(scene.animating or engine.thinking)
+
+    if recorder:
+        recorder.close()
+    if replayer and not replayer.finished:
+        replayer.report()
+    if is_debug_layer_enabled(DEBUG_LAYER_FRAME_STATS):
+        scheduler.log_stats()
+
+    if savegame:
+        # a game is never saved between the moves of the player and Dracula
+        engine.finish_turn()
+        if engine.outcome is None:
+            save_game(state, savegame)
+        elif os.path.exists(savegame):
+            # a finished game is not resumed
+            os.remove(savegame)
 
     pygame.quit()
 
 
 def stresstest_main(n):
+    game = create_snapshot_facade()
     for i in range(n):
         pygame.init()
         pygame.event.post(pygame.event.Event(pygame.QUIT))
-        main()
+        main(game)
         print(f"Stresstest {i}: {round(i / N, 2)}")
     print("Done! 100%")
 
@@ -119,6 +204,12 @@ if __name__ == "__main__":
         from logging import DEBUG
 
         logger.setLevel(DEBUG)
+    elif is_debug_layer_enabled(DEBUG_LAYER_STARTUP_PROFILE) or is_debug_layer_enabled(
+        DEBUG_LAYER_FRAME_STATS
+    ):
+        from logging import INFO
+
+        logger.setLevel(INFO)
 
     if is_debug_layer_enabled(DEBUG_LAYER_STRESSTEST):
         N = 2**8
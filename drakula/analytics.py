@@ -0,0 +1,290 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from .dracula import DraculaBrain, DRACULA_WEIGHT_AVAILABLE
+from .engine import WORLD_DESTROYED_THRESHOLD_PERCENT
+from .logging import logger
+from .state import GameState, AirportStatus, MIN_DEGREE_OF_SEPARATION
+
+# The chain has a state per pair of airports, beyond this it stops being a matter of milliseconds
+ANALYTICS_MAX_AIRPORTS = 64
+# As often as `simulation.random_policy` waits, so simulations can check the numbers
+ANALYTICS_WAIT_PROBABILITY = 0.1
+ANALYTICS_TOLERANCE = 1e-9
+
+
+class WorldDifficulty(NamedTuple):
+    # Chances of a player flying at random, see `analyze_world`
+    win_probability: float
+    caught_probability: float
+    destroyed_probability: float
+    # Rounds until the game is decided
+    expected_turns: float
+    # Moves of Dracula until enough of the world is destroyed, regardless of the player
+    destruction_turns: float
+
+    @property
+    def score(self) -> float:
+        """
+        :returns: 0 for a world the player always wins, 1 for one he always loses
+        """
+        return 1 - self.win_probability
+
+
+def destroyed_threshold_count(n: int) -> int:
+    """
+    :returns: The amount of destroyed airports at which the game is lost
+    """
+    k = n * WORLD_DESTROYED_THRESHOLD_PERCENT // 100
+    while round(100 * k / n) <= WORLD_DESTROYED_THRESHOLD_PERCENT:
+        k += 1
+    return k
+
+
+def destruction_chain(state: GameState):
+    """
+    The transient part of the absorbing chain of how many airports Dracula destroyed, from the
+    start of a game. Whatever a row lacks to sum up to 1 is the chance of the threshold of
+    `destroyed_threshold_count` being reached with that move.
+
+    Dracula destroys every airport he leaves unless it was destroyed already. The chain counts
+    the destroyed airports and whether Dracula stands on a fresh one, state `2 * (k - 1) + fresh`
+    for `k` destroyed airports. How likely his next airport is fresh is averaged over the world,
+    assuming a share of the neighbours of every airport as large as the destroyed share of the
+    whole world is destroyed.
+
+    :returns: A sparse matrix, the first state is the start of the game
+    """
+    from scipy.sparse import csr_matrix
+
+    n = len(state.airports)
+    threshold = destroyed_threshold_count(n)
+    degrees = state.graph.degrees.astype(np.float64)
+    # a random walk spends time at every airport proportional to its amount of connections
+    visits = degrees / degrees.sum()
+
+    def fresh_probability(destroyed: int) -> float:
+        share = destroyed / n
+        available = (1 - share) * degrees * DRACULA_WEIGHT_AVAILABLE
+        # every destroyed neighbour weighs one over the degree, see `transition_weights`
+        return float(visits @ (available / (available + share)))
+
+    rows, columns, probabilities = [], [], []
+    for destroyed in range(1, threshold):
+        for fresh in (0, 1):
+            after = destroyed + fresh
+            if after >= threshold:
+                continue
+            p = fresh_probability(after)
+            rows += [2 * (destroyed - 1) + fresh] * 2
+            columns += [2 * (after - 1) + 1, 2 * (after - 1)]
+            probabilities += [p, 1 - p]
+
+    size = 2 * (threshold - 1)
+    return csr_matrix((probabilities, (rows, columns)), shape=(size, size))
+
+
+def expected_destruction_turns(state: GameState) -> float:
+    """
+    :returns: Expected moves of Dracula until enough of the world is destroyed to lose, from the
+    start of a game and regardless of the player, see `destruction_chain`
+    """
+    from scipy.sparse import identity
+    from scipy.sparse.linalg import spsolve
+
+    transient = destruction_chain(state)
+    turns = spsolve((identity(transient.shape[0]) - transient).tocsc(), np.ones(transient.shape[0]))
+    # the airport Dracula starts on counts as destroyed already
+    return float(np.atleast_1d(turns)[0])
+
+
+def player_matrix(state: GameState, destroyed_share: float):
+    """
+    :returns: A sparse matrix with the probability of a player flying at random from the
+    airport of the row to the airport of the column, waiting on the diagonal. He waits with a
+    chance of `ANALYTICS_WAIT_PROBABILITY` or if every connected airport is destroyed, each
+    of them is with a chance of `destroyed_share`.
+    """
+    from scipy.sparse import csr_matrix
+
+    graph = state.graph
+    n = len(graph)
+    available = state.status[graph.indices] == AirportStatus.AVAILABLE
+    counts = np.bincount(graph.edge_sources, available, minlength=n)
+    # chance of some connected airport being left to fly to, none at all if `counts` is 0
+    moving = (1 - ANALYTICS_WAIT_PROBABILITY) * (1 - destroyed_share**counts)
+    flights = available * (moving / np.maximum(counts, 1))[graph.edge_sources]
+    return csr_matrix(
+        (
+            np.concatenate([flights, 1 - moving]),
+            (
+                np.concatenate([graph.edge_sources, np.arange(n)]),
+                np.concatenate([graph.indices, np.arange(n)]),
+            ),
+        ),
+        shape=(n, n),
+    )
+
+
+class WorldAnalysis:
+    """
+    The absorbing Markov chain of a game on a world, with a transient state for every pair of
+    airports of Dracula and the player and every state of `destruction_chain`.
+
+    The player flies uniformly to one of the connected airports which are still available or
+    waits, Dracula flies like `DraculaBrain` with the probabilities of the start of the game.
+    Destroyed airports are assumed to be spread evenly, independent of where Dracula is, so the
+    chain underestimates how quickly the two meet in what is left of the world. The numbers are
+    meant for comparing worlds. Traps are not set, so `TRAP_TIMEOUT_TURNS` and
+    `INITIAL_TRAP_COUNT` only make the player stronger than assumed here.
+
+    The destruction chain never goes back, so the system is solved block by block from its
+    last state to its first. A block is a matrix over pairs of airports, the moves of both are
+    applied one after another instead of forming their Kronecker product. The outcomes of every
+    possible start come out at once.
+
+    :param state: A game about to start
+    """
+
+    def __init__(self, state: GameState):
+        n = len(state.airports)
+        if n > ANALYTICS_MAX_AIRPORTS:
+            raise ValueError(
+                f"Worlds of {n} airports are too large to analyze, at most {ANALYTICS_MAX_AIRPORTS}"
+            )
+        self.n = n
+        self.state = state
+
+        # indexed by the airport of Dracula, the one of the player and the outcome
+        apart = (1 - np.eye(n))[:, :, None]
+        meeting = np.eye(n)[:, :, None]
+        dracula = DraculaBrain().transition_matrix(state)
+
+        def dracula_moves(values: np.ndarray) -> np.ndarray:
+            return (dracula @ values.reshape(n, -1)).reshape(values.shape)
+
+        # chances of the game ending with the move of Dracula, or going on
+        dracula_catches = apart * dracula_moves(meeting)
+        dracula_misses = apart * dracula_moves(apart)
+
+        self.destruction_turns = expected_destruction_turns(state)
+        destruction = destruction_chain(state)
+        # chance of the threshold being reached from every state of the destruction chain
+        destroying = 1 - np.asarray(destruction.sum(axis=1)).ravel()
+
+        # outcome columns: won, caught, destroyed, turns
+        solution = np.zeros((destruction.shape[0], n, n, 4))
+        for stage in reversed(range(destruction.shape[0])):
+            player = player_matrix(state, (stage // 2 + 1) / n)
+
+            def player_moves(values: np.ndarray) -> np.ndarray:
+                moved = player @ values.transpose(1, 0, 2).reshape(n, -1)
+                return moved.reshape(n, n, -1).transpose(1, 0, 2)
+
+            def next_round(values: np.ndarray) -> np.ndarray:
+                # the player moves first, then Dracula
+                return player_moves(apart * dracula_moves(apart * values))
+
+            right_hand_side = player_moves(
+                np.concatenate(
+                    [
+                        meeting,
+                        dracula_catches,
+                        destroying[stage] * dracula_misses,
+                        np.ones((n, n, 1)),
+                    ],
+                    axis=2,
+                )
+            )
+            row = destruction.getrow(stage)
+            staying = row[0, stage]
+            following = sum(
+                probability * solution[column]
+                for column, probability in zip(row.indices, row.data)
+                if column != stage
+            )
+            if row.nnz > (staying != 0):
+                right_hand_side += next_round(following)
+
+            # (I - staying * next_round) x = right_hand_side, the series converges since a
+            # round never adds probability and `staying` is below 1
+            values = term = right_hand_side
+            while np.abs(term).max() > ANALYTICS_TOLERANCE:
+                term = staying * next_round(term)
+                values = values + term
+            solution[stage] = values
+
+        # the game starts in the first state of the destruction chain
+        self.win_probability = solution[0, :, :, 0]
+        self.caught_probability = solution[0, :, :, 1]
+        self.destroyed_probability = solution[0, :, :, 2]
+        self.expected_turns = solution[0, :, :, 3]
+
+    def valid_starts(self) -> np.ndarray:
+        """
+        :returns: A mask over pairs of Dracula and player airports, True where `new_game` may
+        place them
+        """
+        hops = self.state.graph.hop_distance_matrix()
+        return (hops < 0) | (hops >= MIN_DEGREE_OF_SEPARATION)
+
+    def balanced_starts(self, min_win_probability: float, max_win_probability: float) -> np.ndarray:
+        """
+        :returns: The pairs of Dracula and player airports `new_game` may pick with a chance of
+        winning within the bounds, one per row
+        """
+        return np.argwhere(
+            self.valid_starts()
+            & (self.win_probability >= min_win_probability)
+            & (self.win_probability <= max_win_probability)
+        )
+
+    def closest_starts(
+        self, min_win_probability: float, max_win_probability: float
+    ) -> tuple[np.ndarray, float]:
+        """
+        :returns: The pairs of Dracula and player airports `new_game` may pick with a chance of
+        winning closest to the bounds, one per row, and how far outside the bounds that is.
+        The distance is 0 when they are the `balanced_starts`.
+        """
+        distance = np.maximum(
+            min_win_probability - self.win_probability,
+            self.win_probability - max_win_probability,
+        ).clip(0)
+        distance[~self.valid_starts()] = np.inf
+        closest = distance.min()
+        return np.argwhere(distance == closest), float(closest)
+
+    def difficulty(self, dracula_location: int, player_location: int) -> WorldDifficulty:
+        d, p = dracula_location, player_location
+        return WorldDifficulty(
+            float(self.win_probability[d, p]),
+            float(self.caught_probability[d, p]),
+            float(self.destroyed_probability[d, p]),
+            float(self.expected_turns[d, p]),
+            self.destruction_turns,
+        )
+
+    def world_difficulty(self) -> WorldDifficulty:
+        """
+        :returns: The difficulty averaged over all starts `new_game` may pick
+        """
+        valid = self.valid_starts()
+        return WorldDifficulty(
+            float(self.win_probability[valid].mean()),
+            float(self.caught_probability[valid].mean()),
+            float(self.destroyed_probability[valid].mean()),
+            float(self.expected_turns[valid].mean()),
+            self.destruction_turns,
+        )
+
+
+def analyze_world(state: GameState) -> WorldDifficulty:
+    """
+    :returns: The difficulty of the game in `state`, see `WorldAnalysis`
+    """
+    analysis = WorldAnalysis(state)
+    difficulty = analysis.difficulty(state.dracula_location, state.player_location)
+    logger.debug(f"World difficulty: {difficulty}")
+    return difficulty
@@ -0,0 +1,98 @@
+import numpy as np
+
+from .dracula import DraculaBrain
+from .state import GameState, AirportStatus, MIN_DEGREE_OF_SEPARATION
+
+
+class BeliefTracker:
+    """
+    Probability of Dracula being at every airport, as far as the player can tell. Every turn the
+    belief is pushed through the transition matrix of `DraculaBrain` and conditioned on what the
+    player sees: the airport Dracula left is destroyed, the trap warnings, and Dracula not
+    being where the player is.
+
+    The airport Dracula left is known, so the matrix-vector product only ever touches the rows
+    of a few airports and an update costs little more than a pass over the belief.
+    """
+
+    def __init__(self, state: GameState):
+        self.model = DraculaBrain()
+        self.belief = np.zeros(len(state.airports))
+        self.reset(state)
+
+    def reset(self, state: GameState):
+        """
+        Forget everything but what the current state shows
+        """
+        if len(state.dracula_trail) == 1:
+            # Dracula has not moved yet, so he is where a new game puts him
+            hops = state.graph.hop_distances(state.player_location)
+            prior = ((hops < 0) | (hops >= MIN_DEGREE_OF_SEPARATION)).astype(np.float64)
+        else:
+            prior = np.ones(len(state.airports))
+        self.belief = self._condition(state, prior)
+        self._epoch = state.epoch
+        self._changes_read = state.change_count
+
+    def _condition(self, state: GameState, belief: np.ndarray) -> np.ndarray:
+        trapped = state.status == AirportStatus.TRAPPED
+        near_trap = np.zeros(len(belief), dtype=bool)
+        if state.trapped:
+            near_trap[state.graph.neighbours_of(list(state.trapped))] = True
+
+        posterior = belief * (trapped if state.dracula_on_trap() else ~trapped)
+        posterior *= near_trap if state.is_dracula_near_trap() else ~near_trap
+        posterior[state.player_location] = 0
+
+        total = posterior.sum()
+        if total <= 0:
+            # the model of Dracula was wrong, keep what is still possible at all
+            posterior = belief.copy()
+            posterior[state.player_location] = 0
+            total = posterior.sum()
+        return posterior / total if total > 0 else posterior
+
+    def _propagate(
+        self, state: GameState, sources: np.ndarray, mass: np.ndarray
+    ) -> np.ndarray:
+        """
+        The product of the transposed transition matrix with a belief which is zero outside of
+        `sources`, touching only the rows of those
+        """
+        graph = state.graph
+        self.model.sync(state)
+        edges = graph.edges_of(sources)
+        counts = graph.degrees[sources]
+        flow = self.model.weights[edges] * np.repeat(mass / self.model.row_sums[sources], counts)
+        return np.bincount(graph.indices[edges], flow, minlength=len(graph))
+
+    def update(self, state: GameState):
+        """
+        Account for the turn which just ended
+        """
+        changes = state.changes_since(self._changes_read)
+        if state.epoch != self._epoch or changes is None:
+            self.reset(state)
+            return
+        self._changes_read = state.change_count
+        # Dracula destroys the airport he leaves, nothing else destroys airports
+        left = [i for i in changes if state.status[i] == AirportStatus.DESTROYED]
+
+        prior = self.belief
+        if left:
+            # weighted by the belief if it agrees, the observation wins otherwise
+            departure = prior[left]
+            if departure.sum() <= 0:
+                departure = np.ones(len(left))
+
+            prior = self._propagate(state, np.array(left), departure)
+
+        self.belief = self._condition(state, prior)
+
+    def most_likely(self, k: int = 1) -> np.ndarray:
+        """
+        :returns: The `k` airports Dracula is most likely at, the likeliest first
+        """
+        k = min(k, len(self.belief))
+        top = np.argpartition(-self.belief, k - 1)[:k]
+        return top[np.argsort(-self.belief[top])]
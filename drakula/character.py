@@ -3,7 +3,8 @@ from string import ascii_letters, digits
 
 import pygame
 
-from .state import GameState, AirportStatus
+from .engine import GameEngine, PlayerAction
+from .state import GameState
 from .logging import logger
 
 
@@ -28,20 +29,36 @@ class Character:
     The current amount of traps available
     input_text: str
     The string which the player enters to move to the next airport. Contains ident of the airport
+
+    The location and the traps are stored in the game state, so snapshots of it cover them.
     """
 
-    def __init__(self, location: int):
-        self.current_location = location
-        self.trap_count = 3
+    def __init__(self, state: GameState):
+        self.state = state
         self.input_text = ""
 
+    @property
+    def current_location(self) -> int:
+        return self.state.player_location
+
+    @current_location.setter
+    def current_location(self, location: int):
+        self.state.player_location = location
+
+    @property
+    def trap_count(self) -> int:
+        return self.state.trap_count
+
+    @trap_count.setter
+    def trap_count(self, count: int):
+        self.state.trap_count = count
+
     def handle_input(
-        self, event: pygame.event.Event, game_state: GameState, scene
+        self, event: pygame.event.Event, engine: GameEngine
     ) -> CharacterInputResult:
         """
         :param event: Event object from pygame containing input data
-        :param game_state: Object of class AirportState
-        :param scene: The current scene being rendered
+        :param engine: The engine the actions of the player are passed to
         :return: Result of handling the event
         """
         self.input_text = self.input_text[-10:]
@@ -50,46 +67,34 @@ class Character:
 
         if event.key == pygame.K_RETURN:
             self.input_text = self.input_text.strip()
+            if engine.thinking:
+                # the typed ident stays, so the move can be confirmed once Dracula moved
+                logger.info("Dracula is still thinking")
+                return CharacterInputResult.Accepted
 
-            idx = game_state.get_index(self.input_text)
+            idx = self.state.get_index(self.input_text)
             self.input_text = ""
-            if (
-                idx not in game_state.graph
-                or idx not in game_state.graph[self.current_location]
-            ):
+            if idx not in self.state.graph[self.current_location]:
                 logger.info("Requested airport does not exist :c")
                 return CharacterInputResult.Accepted
-            if (
-                scene.state.states[idx].status != AirportStatus.AVAILABLE
-                and idx != game_state.dracula_location
-            ):
-                logger.info("Rejected attempt to go to an unavailable airport")
-                return CharacterInputResult.Accepted
-            prev_location = self.current_location
-            self.current_location = idx
-            logger.info(
-                f"Character moves from {game_state.states[prev_location].airport.ident} to {game_state.states[self.current_location].airport.ident}"
-            )
-            return CharacterInputResult.Moved
+            if engine.step(PlayerAction.move(idx)).turn_taken:
+                return CharacterInputResult.Moved
+            return CharacterInputResult.Accepted
+        elif event.key == pygame.K_TAB:
+            self.input_text = self.state.neighbour_trie(
+                self.current_location
+            ).common_prefix(self.input_text)
+            return CharacterInputResult.Accepted
         elif event.key == pygame.K_BACKSPACE:
             self.input_text = self.input_text[:-1]
             return CharacterInputResult.Accepted
         elif event.key == pygame.K_SPACE:
-            logger.info(f"Waiting for a turn")
-            return CharacterInputResult.Moved
+            if engine.step(PlayerAction.wait()).turn_taken:
+                return CharacterInputResult.Moved
+            return CharacterInputResult.Accepted
         elif event.key == pygame.K_BACKSLASH:
-            if self.trap_count == 0:
-                logger.warn(f"Trapping rejected {self.current_location}, 0 traps left")
-            elif (
-                game_state.states[self.current_location].status != AirportStatus.TRAPPED
-            ):
-                self.trap_count -= 1
-                game_state.trap_location(self.current_location)
-                logger.info(
-                    f"Trapped {self.current_location} successful, {self.trap_count} traps left"
-                )
-            else:
-                logger.info(f"May not trap {self.current_location}, already trapped")
+            engine.step(PlayerAction.trap())
+            return CharacterInputResult.Accepted
         else:
             char = event.unicode
             if char in digits + ascii_letters + "-":
@@ -0,0 +1,79 @@
+from typing import Generic, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Key of the value stored in a trie node, never collides with a single character
+_VALUE = ""
+
+
+class PrefixTrie(Generic[T]):
+    """
+    Maps strings to values. Looking up a string or all strings starting with a prefix takes
+    time proportional to the length of the prefix and the amount of matches, not the size of
+    the trie.
+    """
+
+    def __init__(self, items: Iterable[tuple[str, T]] = ()):
+        self._root: dict = {}
+        self._size = 0
+        for key, value in items:
+            self[key] = value
+
+    def _node(self, prefix: str) -> Optional[dict]:
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def __setitem__(self, key: str, value: T):
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, {})
+        if _VALUE not in node:
+            self._size += 1
+        node[_VALUE] = value
+
+    def __contains__(self, key: str) -> bool:
+        node = self._node(key)
+        return node is not None and _VALUE in node
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, key: str, default: Optional[T] = None) -> Optional[T]:
+        node = self._node(key)
+        return default if node is None else node.get(_VALUE, default)
+
+    def complete(self, prefix: str) -> list[tuple[str, T]]:
+        """
+        :returns: Every key starting with `prefix` and its value, sorted by the key
+        """
+        node = self._node(prefix)
+        if node is None:
+            return []
+
+        completions = []
+        stack = [(prefix, node)]
+        while stack:
+            key, node = stack.pop()
+            if _VALUE in node:
+                completions.append((key, node[_VALUE]))
+            # reversed, so the smallest child is popped first
+            for char in sorted((char for char in node if char != _VALUE), reverse=True):
+                stack.append((key + char, node[char]))
+        return completions
+
+    def common_prefix(self, prefix: str) -> str:
+        """
+        :returns: The longest string every key starting with `prefix` starts with, `prefix`
+        itself if there are none
+        """
+        node = self._node(prefix)
+        if node is None:
+            return prefix
+        while _VALUE not in node and len(node) == 1:
+            char, node = next(iter(node.items()))
+            prefix += char
+        return prefix
@@ -1,19 +1,57 @@
 import os
-from typing import TypeVar, Callable, Optional, Union
+from collections import defaultdict
+from time import perf_counter
+from typing import TypeVar, Callable, Optional, Union, Iterable, Iterator, Sequence
 
-from mysql.connector import connect
+import numpy as np
+from pydantic import BaseModel
 
 from .debug import get_dev_seed
-from .models import Airport
-from .utils import list_map, kwarg_id
+from .logging import logger
+from .models import Airport, AIRPORT_UNUSED_COLUMNS
+from .utils import kwarg_id
 
 T = TypeVar("T")
 
+DATABASE_POOL_NAME = "drakula"
+DATABASE_POOL_SIZE = 4
+DATABASE_FETCH_BATCH_SIZE = 1024
+# Airport ids of every continent, kept until the `airport` table changes
+AIRPORT_IDS_CACHE_PATH = os.path.join(".drakula_cache", "airport_ids.npz")
+AIRPORT_IDS_CACHE_VERSION_KEY = "__version__"
+
+
+class QueryStatistics:
+    """
+    Per-query latency counters. Every distinct query string is tracked separately,
+    parameters are not part of the key.
+    """
+
+    def __init__(self):
+        self.count = defaultdict(int)
+        self.total_seconds = defaultdict(float)
+        self.max_seconds = defaultdict(float)
+
+    def record(self, query: str, seconds: float):
+        self.count[query] += 1
+        self.total_seconds[query] += seconds
+        self.max_seconds[query] = max(self.max_seconds[query], seconds)
+
+    def mean_seconds(self, query: str) -> float:
+        return self.total_seconds[query] / max(self.count[query], 1)
+
+    def report(self):
+        for query in sorted(self.total_seconds, key=self.total_seconds.get, reverse=True):
+            logger.debug(
+                f"{self.count[query]}x {round(1000 * self.mean_seconds(query), 2)}ms avg, "
+                f"{round(1000 * self.max_seconds[query], 2)}ms max: {query}"
+            )
+
 
 class Database:
     """
     A class which has all the methods needed for talking to the database with the query
-    provided
+    provided. Connections are taken from a pool and returned after every query.
     """
 
     def __init__(
@@ -22,8 +60,13 @@ class Database:
         port: int = 3306,
         user: Optional[str] = None,
         password: Optional[str] = None,
+        pool_size: int = DATABASE_POOL_SIZE,
     ):
-        self.connection = connect(
+        from mysql.connector.pooling import MySQLConnectionPool
+
+        self.pool = MySQLConnectionPool(
+            pool_name=DATABASE_POOL_NAME,
+            pool_size=pool_size,
             host=host,
             port=port,
             user=user,
@@ -31,30 +74,170 @@ class Database:
             database="flight_game",
             autocommit=False,
         )
+        self.stats = QueryStatistics()
 
     def multi_query(
-        self, query: str, model: Callable[[...], T] = dict
-    ) -> list[Union[list, T]]:
+        self,
+        query: str,
+        model: Callable[[...], T] = dict,
+        params: Iterable = (),
+        *,
+        columns: Optional[Sequence[str]] = None,
+        positional: bool = False,
+        stream: bool = False,
+    ) -> Union[list[Union[list, T]], Iterator[T]]:
         """
-        :param query: The query to be sent to the database for the result
+        :param query: The query to be sent to the database for the result. Values must be passed
+        through `params` using `%s` placeholders, never formatted into the query.
         :param model: The function to produce the final object for each row of the query. Receives each
         associated column as a keyword argument.
+        :param params: Values bound to the placeholders of the prepared statement
+        :param columns: Columns substituted for `{columns}` in the query, see `model_columns`
+        :param positional: Pass the columns to `model` as positional arguments in select order,
+        which skips building a dictionary for every row
+        :param stream: Return a generator which reads the rows in batches from an unbuffered cursor,
+        instead of materializing the whole result. The connection is held until it is exhausted.
         :returns: a list with `model` applied to each element
         """
-        cursor = self.connection.cursor(dictionary=True)
-        cursor.execute(query)
-        return list_map(cursor.fetchall(), model)
+        if columns is not None:
+            query = query.format(columns=", ".join(columns))
+        rows = self._iterate_rows(query, tuple(params), model, positional)
+        return rows if stream else list(rows)
+
+    def _iterate_rows(
+        self, query: str, params: tuple, model: Callable[[...], T], positional: bool
+    ) -> Iterator[T]:
+        start = perf_counter()
+        connection = self.pool.get_connection()
+        try:
+            cursor = connection.cursor(prepared=True)
+            cursor.execute(query, params)
+            names = cursor.column_names
+            while batch := cursor.fetchmany(DATABASE_FETCH_BATCH_SIZE):
+                for row in batch:
+                    yield model(*row) if positional else model(**dict(zip(names, row)))
+            cursor.close()
+        finally:
+            connection.close()
+            self.stats.record(query, perf_counter() - start)
+
+
+def model_columns(model: type[BaseModel], exclude: Iterable[str] = ()) -> list[str]:
+    """
+    :param model: The pydantic model rows are converted to
+    :param exclude: Fields to leave out, they must have a default value
+    :returns: The names of the columns to select for `model`
+    """
+    exclude = set(exclude)
+    return [name for name in model.model_fields if name not in exclude]
+
+
+def sample_airport_ids(
+    airport_ids: dict[str, np.ndarray],
+    amount: int,
+    continents: Iterable[str],
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """
+    :param airport_ids: Sorted airport ids of every continent
+    :param amount: Amount of airports to pick from every continent, fewer if the continent is smaller
+    :param continents: Continents to sample from, in order
+    :param seed: Seed for the random number generator, the same seed produces the same ids
+    :returns: The sampled ids, grouped by continent in the order given
+    """
+    rng = np.random.default_rng(seed)
+    sampled = [
+        rng.choice(airport_ids[continent], min(amount, len(airport_ids[continent])), replace=False)
+        for continent in continents
+    ]
+    return np.concatenate(sampled) if sampled else np.empty(0, dtype=np.int64)
+
+
+def query_airport_ids(db: Database) -> dict[str, np.ndarray]:
+    """
+    Only the primary key and the continent are read, so the table is never sorted as a whole.
+
+    :param db: The database to query
+    :returns: Sorted airport ids of every continent
+    """
+    rows = db.multi_query(
+        "select id, continent from airport order by id",
+        lambda id, continent: (id, continent),
+        positional=True,
+        stream=True,
+    )
+    ids_by_continent = defaultdict(list)
+    for airport_id, continent in rows:
+        ids_by_continent[continent].append(airport_id)
+    return {
+        continent: np.array(ids, dtype=np.int64) for continent, ids in ids_by_continent.items()
+    }
+
+
+def load_airport_ids(db: Database, path: str = AIRPORT_IDS_CACHE_PATH) -> dict[str, np.ndarray]:
+    """
+    :param db: The database to query
+    :param path: Where the ids are cached, they are queried again once the `table_version`
+    differs from the cached one
+    :returns: Sorted airport ids of every continent
+    """
+    version = table_version(db)
+    try:
+        with np.load(path) as cached:
+            cached_version = tuple(
+                None if value == "" else str(value)
+                for value in cached[AIRPORT_IDS_CACHE_VERSION_KEY]
+            )
+            if version_matches(cached_version, version):
+                return {
+                    continent: cached[continent]
+                    for continent in cached.files
+                    if continent != AIRPORT_IDS_CACHE_VERSION_KEY
+                }
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug(f"No usable airport id cache in {path}: {e}")
+
+    airport_ids = query_airport_ids(db)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    staging = path + ".tmp"
+    with open(staging, "wb") as file:
+        np.savez(
+            file,
+            **airport_ids,
+            **{AIRPORT_IDS_CACHE_VERSION_KEY: np.array([value or "" for value in version])},
+        )
+    os.replace(staging, path)
+    return airport_ids
+
+
 class GameDatabaseFacade:
-    def __init__(self, db):
+    def __init__(self, db, airport_ids_path: str = AIRPORT_IDS_CACHE_PATH):
         self.db = db
-        self._continents = list()
-        self._continents = self.db.multi_query(
-            "select distinct continent from airport", kwarg_id("continent")
+        # Sampling happens in Python and the chosen rows are fetched by id
+        self._airport_ids = load_airport_ids(db, airport_ids_path)
+        self._continents = sorted(self._airport_ids)
+
+    def fetch_airports_by_id(self, ids: Iterable[int]) -> list[Airport]:
+        """
+        :param ids: Primary keys of the airports
+        :returns: A list of Airport objects in the same order as `ids`
+        """
+        ids = [int(i) for i in ids]
+        if not ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(ids))
+        airports = self.db.multi_query(
+            f"select {{columns}} from airport where id in ({placeholders})",
+            Airport,
+            ids,
+            columns=model_columns(Airport, exclude=AIRPORT_UNUSED_COLUMNS),
         )
+        by_id = {airport.id: airport for airport in airports}
+        return [by_id[i] for i in ids]
 
     def fetch_random_airports(
         self,
-            amount: int = 1,
+        amount: int = 1,
         continent: Optional[str] = None,
         *,
         seed: Optional[int] = None,
@@ -69,14 +252,79 @@ class GameDatabaseFacade:
         continent = continent or "EU"
         if continent and continent not in self._continents:
             raise Exception(f"Continent `{continent}` does not exist")
-        query = f"select * from airport"
-        if continent:
-            query += f" where airport.continent = '{continent}'"
-        query += f" order by RAND({'' if seed is None else seed}) limit {amount}"
-        return list_map(self.db.multi_query(query), Airport)
+        ids = sample_airport_ids(self._airport_ids, amount, [continent], seed)
+        return self.fetch_airports_by_id(ids)
 
+    def fetch_random_airports_per_continent(
+        self,
+        amount: int = 1,
+        *,
+        seed: Optional[int] = None,
+    ) -> list[Airport]:
+        """
+        Fetch `amount` random airports for every continent in a single round trip.
 
-def create_database_facade() -> GameDatabaseFacade:
+        :param amount: Amount of random airports to generate per continent
+        :param seed: Seed for the random number generator, see `fetch_random_airports`
+        :returns: A list of Airport objects, grouped by continent
+        """
+        ids = sample_airport_ids(self._airport_ids, amount, self._continents, seed)
+        return self.fetch_airports_by_id(ids)
+
+
+def table_fingerprint(db: Database, table: str = "airport") -> tuple[int, int]:
+    """
+    Reads every row, so it is only used when a snapshot is exported, see `table_version` for
+    the cheap check.
+
+    :param db: The database to query
+    :param table: Name of the table, never user input
+    :returns: Row count and checksum of the table, changes whenever the contents change
+    """
+    (row_count,) = db.multi_query(f"select count(*) as row_count from {table}", kwarg_id("row_count"))
+    (checksum,) = db.multi_query(f"checksum table {table}", kwarg_id("Checksum"))
+    return int(row_count), int(checksum or 0)
+
+
+def table_version(db: Database, table: str = "airport") -> tuple[Optional[str], Optional[str]]:
+    """
+    Read from `information_schema` without touching the rows. A reimported table is created
+    anew, other writes move the update time.
+
+    :param db: The database to query
+    :param table: Name of the table
+    :returns: When the table was created and last updated, None where the server does not know.
+    InnoDB forgets the update time when the server restarts.
+    """
+
+    def timestamps(create_time, update_time):
+        return tuple(None if time is None else str(time) for time in (create_time, update_time))
+
+    versions = db.multi_query(
+        "select create_time, update_time from information_schema.tables "
+        "where table_schema = database() and table_name = %s",
+        timestamps,
+        [table],
+        positional=True,
+    )
+    return versions[0] if versions else (None, None)
+
+
+def version_matches(
+    stored: tuple[Optional[str], Optional[str]], current: tuple[Optional[str], Optional[str]]
+) -> bool:
+    """
+    :param stored: `table_version` when a copy of the table was taken
+    :param current: `table_version` of the table now
+    :returns: False if the table changed in between
+    """
+    if stored[0] != current[0]:
+        return False
+    # an update time the server forgot after a restart says nothing
+    return current[1] is None or current[1] == stored[1]
+
+
+def create_database() -> Database:
     """
     :returns: An established database connection based on environmental variables.
     """
@@ -85,5 +333,11 @@ def create_database_facade() -> GameDatabaseFacade:
     user = os.getenv("DRAKULA_USER")
     password = os.getenv("DRAKULA_PASSWORD")
 
-    db = Database(host, port, user, password)
-    return GameDatabaseFacade(db)
+    return Database(host, port, user, password)
+
+
+def create_database_facade() -> GameDatabaseFacade:
+    """
+    :returns: An established database connection based on environmental variables.
+    """
+    return GameDatabaseFacade(create_database())
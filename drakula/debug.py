@@ -7,6 +7,9 @@ DEBUG_LAYER_SHOW_SOLAR_TERMINATOR = "SHOW_SOLAR_TERMINATOR"
 DEBUG_LAYER_TIMESKIP = "TIMESKIP"
 DEBUG_LAYER_STRESSTEST = "STRESSTEST"
 DEBUG_LAYER_LOG_VERBOSE = "LOG_VERBOSE"
+DEBUG_LAYER_STARTUP_PROFILE = "STARTUP_PROFILE"
+DEBUG_LAYER_FRAME_STATS = "FRAME_STATS"
+DEBUG_LAYER_DISPERSION_CHECK = "DISPERSION_CHECK"
 
 
 def debug_layers():
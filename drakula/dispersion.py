@@ -0,0 +1,319 @@
+from logging import INFO, WARNING
+from typing import Callable, Optional
+
+import numpy as np
+
+from .debug import is_debug_layer_enabled, DEBUG_LAYER_DISPERSION_CHECK
+from .graph import AirportGraph
+from .logging import logger
+from .maths import geo_pos_to_screen_pos
+from .models import AirportTable
+from .triangulation import graph_from_airports
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 2 * np.pi * EARTH_RADIUS_MILES / 360
+# No two points within a square of the screen with this side are further apart than this
+SCREEN_UNIT_MILES = np.hypot(360, 180) * MILES_PER_DEGREE
+
+AIRPORT_DISPERSION_MAX_STEPS = 16
+AIRPORT_DISPERSION_TOLERANCE_DEG = 1e-4
+# The airports only move a little per step, so their connections and charges are kept this long
+AIRPORT_DISPERSION_TRIANGULATION_STEPS = 4
+
+DISPERSION_CHARGE_COEFFICIENT = 0.04
+# Pairs pushed by less than this are ignored, same as `np.isclose(magnitude, 0)`
+DISPERSION_MAGNITUDE_EPSILON = 1e-8
+# Rows of the pairwise matrices computed at once, bounds the memory of the exact engine
+DISPERSION_BLOCK_SIZE = 512
+
+BARNES_HUT_THRESHOLD = 1024
+BARNES_HUT_OPENING_RATIO = 0.5
+BARNES_HUT_LEAF_SIZE = 16
+# Largest deviation from the exact displacements tolerated by `DEBUG_LAYER_DISPERSION_CHECK`,
+# relative to the largest displacement. Measured below 0.002 on random and clustered worlds.
+BARNES_HUT_MAX_ERROR = 0.01
+
+
+def haversine_miles(lat1_deg, lon1_deg, lat2_deg, lon2_deg) -> np.ndarray:
+    """
+    :returns: Great-circle distances between the points in miles, broadcasting like numpy
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1_deg, lon1_deg, lat2_deg, lon2_deg))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def airport_charges(graph: AirportGraph) -> np.ndarray:
+    """
+    :returns: The charge of every airport, the logarithm of its amount of connections
+    """
+    return np.log2(np.maximum(graph.degrees, 1))
+
+
+def pair_displacements(
+    target_geo: np.ndarray,
+    target_screen: np.ndarray,
+    source_geo: np.ndarray,
+    source_screen: np.ndarray,
+    source_charge: np.ndarray,
+    dt: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Push every target away from its source. All arguments broadcast against each other,
+    positions have their two coordinates in the last axis.
+
+    :returns: Change of the latitude and longitude of the targets
+    """
+    r = haversine_miles(
+        target_geo[..., 0], target_geo[..., 1], source_geo[..., 0], source_geo[..., 1]
+    )
+    v = target_screen - source_screen
+    norm = np.linalg.norm(v, axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # k * q1 * q2 / r^2 divided by the mass q1 of the target
+        magnitude = DISPERSION_CHARGE_COEFFICIENT * source_charge / r**2 * (dt**2 / 2)
+        active = (r > 0) & (norm > 0) & (magnitude > DISPERSION_MAGNITUDE_EPSILON)
+        scale = np.where(active, magnitude / norm, 0)
+    # undo the equirectangular projection, so displacements stay additive
+    return -180 * scale * v[..., 1], 360 * scale * v[..., 0]
+
+
+def cutoff_distance_miles(max_charge: float, dt: float) -> float:
+    """
+    :returns: The distance after which no airport is pushed anymore, see `DISPERSION_MAGNITUDE_EPSILON`
+    """
+    return np.sqrt(DISPERSION_CHARGE_COEFFICIENT * max_charge * (dt**2 / 2) / DISPERSION_MAGNITUDE_EPSILON)
+
+
+def exact_displacements(
+    geo: np.ndarray, screen: np.ndarray, charges: np.ndarray, dt: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sum the push of every airport on every other one, O(n^2) in blocks of rows.
+    """
+    n = len(geo)
+    lat, lon = np.zeros(n), np.zeros(n)
+    for begin in range(0, n, DISPERSION_BLOCK_SIZE):
+        end = min(begin + DISPERSION_BLOCK_SIZE, n)
+        dlat, dlon = pair_displacements(
+            geo[begin:end, None], screen[begin:end, None], geo[None], screen[None], charges, dt
+        )
+        rows = np.arange(end - begin)
+        dlat[rows, rows + begin] = 0
+        dlon[rows, rows + begin] = 0
+        lat[begin:end] = dlat.sum(axis=1)
+        lon[begin:end] = dlon.sum(axis=1)
+    return lat, lon
+
+
+class QuadTree:
+    """
+    Quadtree over the screen positions of the airports. Every node stores the total charge of
+    the airports inside it and their charge-weighted centroid.
+    """
+
+    def __init__(self, screen: np.ndarray, charges: np.ndarray, leaf_size: int):
+        centers, half_sizes, node_charges, centroids, children, ranges = [], [], [], [], [], []
+        order = []
+
+        low, high = screen.min(axis=0), screen.max(axis=0)
+        stack = [(np.arange(len(screen)), (low + high) / 2, max(*(high - low)) / 2 + 1e-9, -1, 0)]
+        while stack:
+            indices, center, half_size, parent, quadrant = stack.pop()
+            node = len(centers)
+            if parent >= 0:
+                children[parent][quadrant] = node
+
+            charge = charges[indices].sum()
+            weights = charges[indices] if charge > 0 else np.ones(len(indices))
+            centers.append(center)
+            half_sizes.append(half_size)
+            node_charges.append(charge)
+            centroids.append(np.average(screen[indices], axis=0, weights=weights))
+            children.append([-1, -1, -1, -1])
+
+            if len(indices) <= leaf_size or half_size < 1e-9:
+                ranges.append((len(order), len(order) + len(indices)))
+                order.extend(indices)
+                continue
+            ranges.append((0, 0))
+
+            right = screen[indices, 0] >= center[0]
+            bottom = screen[indices, 1] >= center[1]
+            for quadrant, mask in enumerate(
+                (~right & ~bottom, right & ~bottom, ~right & bottom, right & bottom)
+            ):
+                if mask.any():
+                    offset = np.array([1 if quadrant % 2 else -1, 1 if quadrant // 2 else -1])
+                    stack.append(
+                        (indices[mask], center + offset * half_size / 2, half_size / 2, node, quadrant)
+                    )
+
+        self.centers = np.array(centers)
+        self.half_sizes = np.array(half_sizes)
+        self.charges = np.array(node_charges)
+        self.centroids = np.array(centroids)
+        self.children = np.array(children)
+        self.ranges = np.array(ranges)
+        self.order = np.array(order, dtype=np.int64)
+        self.is_leaf = (self.children < 0).all(axis=1)
+
+
+def barnes_hut_displacements(
+    geo: np.ndarray,
+    screen: np.ndarray,
+    charges: np.ndarray,
+    dt: float,
+    opening_ratio: float = BARNES_HUT_OPENING_RATIO,
+    leaf_size: int = BARNES_HUT_LEAF_SIZE,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Approximate `exact_displacements` in O(n log n). Far-away groups of airports push as a
+    single charge at their centroid, groups out of reach are skipped entirely. The tree is
+    walked for all airports at once, one level at a time.
+    """
+    n = len(geo)
+    cutoff_miles = cutoff_distance_miles(charges.max(initial=0), dt)
+    tree = QuadTree(screen, charges, leaf_size)
+    centroid_geo = np.column_stack(
+        (90 - 180 * tree.centroids[:, 1], 360 * tree.centroids[:, 0] - 180)
+    )
+    lat, lon = np.zeros(n), np.zeros(n)
+
+    def accumulate(targets, source_geo, source_screen, source_charge):
+        dlat, dlon = pair_displacements(
+            geo[targets], screen[targets], source_geo, source_screen, source_charge, dt
+        )
+        lat[:] += np.bincount(targets, weights=dlat, minlength=n)
+        lon[:] += np.bincount(targets, weights=dlon, minlength=n)
+
+    targets, nodes = np.arange(n), np.zeros(n, dtype=np.int64)
+    while len(targets):
+        inside = np.all(
+            np.abs(screen[targets] - tree.centers[nodes]) <= tree.half_sizes[nodes, None],
+            axis=1,
+        )
+        r = haversine_miles(
+            geo[targets, 0], geo[targets, 1], centroid_geo[nodes, 0], centroid_geo[nodes, 1]
+        )
+        # overestimates the size away from the equator
+        size_miles = 2 * tree.half_sizes[nodes] * SCREEN_UNIT_MILES
+        in_reach = inside | (r - size_miles < cutoff_miles)
+        targets, nodes, inside, r, size_miles = (
+            x[in_reach] for x in (targets, nodes, inside, r, size_miles)
+        )
+        with np.errstate(divide="ignore"):
+            accepted = ~inside & (size_miles / r < opening_ratio)
+
+        accepted_nodes = nodes[accepted]
+        accumulate(
+            targets[accepted],
+            centroid_geo[accepted_nodes],
+            tree.centroids[accepted_nodes],
+            tree.charges[accepted_nodes],
+        )
+
+        opened = ~accepted & tree.is_leaf[nodes]
+        leaf_targets, leaves = targets[opened], nodes[opened]
+        begins, ends = tree.ranges[leaves, 0], tree.ranges[leaves, 1]
+        counts = ends - begins
+        pair_targets = np.repeat(leaf_targets, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        sources = tree.order[np.repeat(begins, counts) + offsets]
+        distinct = pair_targets != sources
+        pair_targets, sources = pair_targets[distinct], sources[distinct]
+        accumulate(pair_targets, geo[sources], screen[sources], charges[sources])
+
+        expanded = ~accepted & ~tree.is_leaf[nodes]
+        children = tree.children[nodes[expanded]]
+        targets = np.repeat(targets[expanded], 4)
+        nodes = children.reshape(-1)
+        targets, nodes = targets[nodes >= 0], nodes[nodes >= 0]
+
+    return lat, lon
+
+
+def barnes_hut_error(
+    geo: np.ndarray,
+    screen: np.ndarray,
+    charges: np.ndarray,
+    dt: float,
+    approximation: Optional[tuple[np.ndarray, np.ndarray]] = None,
+) -> float:
+    """
+    Compare the Barnes-Hut approximation with `exact_displacements`, which costs O(n^2)
+
+    :param approximation: The result of `barnes_hut_displacements` for the same arguments,
+    computed if None
+    :returns: The largest deviation of a coordinate, relative to the largest exact change of one
+    """
+    lat, lon = approximation or barnes_hut_displacements(geo, screen, charges, dt)
+    exact_lat, exact_lon = exact_displacements(geo, screen, charges, dt)
+    scale = max(np.abs(exact_lat).max(initial=0), np.abs(exact_lon).max(initial=0))
+    deviation = max(
+        np.abs(lat - exact_lat).max(initial=0), np.abs(lon - exact_lon).max(initial=0)
+    )
+    return deviation / scale if scale > 0 else deviation
+
+
+def disperse_airports_inplace(
+    airports: AirportTable,
+    dt=0.1,
+    graph: Optional[AirportGraph] = None,
+) -> float:
+    """
+    Push the airports away from each other for one step. Airports with more connections
+    push harder. Uses the Barnes-Hut approximation for large worlds.
+
+    :param airports: The airports to move
+    :param dt: Length of the step
+    :param graph: Connections of the airports, triangulated from the airports if None
+    :returns: The largest change of a coordinate in degrees
+    """
+    graph = graph_from_airports(airports) if graph is None else graph
+    charges = airport_charges(graph)
+    geo = airports.geo_positions
+    screen = geo_pos_to_screen_pos(geo[:, 0], geo[:, 1]).T
+
+    if len(airports) > BARNES_HUT_THRESHOLD:
+        lat, lon = barnes_hut_displacements(geo, screen, charges, dt)
+        if is_debug_layer_enabled(DEBUG_LAYER_DISPERSION_CHECK):
+            error = barnes_hut_error(geo, screen, charges, dt, (lat, lon))
+            logger.log(
+                WARNING if error > BARNES_HUT_MAX_ERROR else INFO,
+                f"Barnes-Hut dispersion is off by {error:.2e} of the largest displacement",
+            )
+    else:
+        lat, lon = exact_displacements(geo, screen, charges, dt)
+
+    airports.set_geo_positions(geo[:, 0] + lat, geo[:, 1] + lon)
+    return float(max(np.abs(lat).max(initial=0), np.abs(lon).max(initial=0)))
+
+
+def disperse_airports(
+    airports: AirportTable,
+    max_steps: int = AIRPORT_DISPERSION_MAX_STEPS,
+    tolerance: float = AIRPORT_DISPERSION_TOLERANCE_DEG,
+    dt=0.1,
+    on_step: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Disperse the airports until no coordinate changes by more than `tolerance` degrees.
+    The airports are triangulated again every `AIRPORT_DISPERSION_TRIANGULATION_STEPS` steps.
+
+    :param on_step: Called with the index of the step and `max_steps` before every step
+    :returns: The amount of steps taken
+    """
+    graph = None
+    for step in range(max_steps):
+        if on_step:
+            on_step(step, max_steps)
+        if step % AIRPORT_DISPERSION_TRIANGULATION_STEPS == 0:
+            graph = graph_from_airports(airports)
+        if disperse_airports_inplace(airports, dt, graph) < tolerance:
+            return step + 1
+    return max_steps
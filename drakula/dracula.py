@@ -1,11 +1,117 @@
+from typing import Optional
+
+import numpy as np
+
+from .graph import AirportGraph
 from .state import GameState, AirportStatus
 
+DRACULA_WEIGHT_AVAILABLE = 1.0
+DRACULA_WEIGHT_TRAPPED = 1.2
+# A brain following another copy of the game starts over once more of the airports differ
+DRACULA_SYNC_REBUILD_FRACTION = 0.125
+
+
+def transition_weights(status: np.ndarray, source_degrees: np.ndarray) -> np.ndarray:
+    """
+    :param status: Status of the airport every edge leads to
+    :param source_degrees: Amount of connections of the airport every edge starts at
+    :returns: The unnormalized weight of every edge
+    """
+    weights = np.full(len(status), DRACULA_WEIGHT_AVAILABLE)
+    # destroyed airports weigh one over the amount of connections of the airport Dracula is at
+    destroyed = status == AirportStatus.DESTROYED
+    weights[destroyed] = 1 / source_degrees[destroyed]
+    weights[status == AirportStatus.TRAPPED] = DRACULA_WEIGHT_TRAPPED
+    return weights
+
 
 class DraculaBrain:
     """
     A class having the logic behind the movement of the dracula
+
+    The weight of every flight is kept aligned with the CSR arrays of the graph. A status change
+    only touches the weights of the flights leading into that airport, so a turn costs the same
+    no matter the size of the world. A brain handed a clone or a restored copy of the game it
+    follows compares the statuses instead of starting over.
     """
 
+    # Brains deciding in the background implement `submit`, see `GameEngine.poll`
+    asynchronous = False
+
+    def __init__(self):
+        self._state: Optional[GameState] = None
+        self._epoch = -1
+        self._changes_read = 0
+        # the statuses the weights were computed from
+        self._status = np.zeros(0, dtype=np.uint8)
+        self.weights = np.zeros(0)
+        self.row_sums = np.zeros(0)
+
+    def _rebuild(self, state: GameState):
+        graph = state.graph
+        self.weights = transition_weights(
+            state.status[graph.indices], graph.degrees[graph.edge_sources]
+        )
+        self.row_sums = np.bincount(graph.edge_sources, self.weights, minlength=len(graph))
+        self._status = state.status.copy()
+        self._follow(state)
+
+    def _follow(self, state: GameState):
+        self._state = state
+        self._epoch = state.epoch
+        self._changes_read = state.change_count
+
+    def _update(self, graph: AirportGraph, state: GameState, changed: int):
+        begin, end = graph.indptr[changed], graph.indptr[changed + 1]
+        incoming = graph.reverse_edges[begin:end]
+        sources = graph.indices[begin:end]
+        self.weights[incoming] = transition_weights(
+            np.full(len(incoming), state.status[changed]), graph.degrees[sources]
+        )
+        for source in sources:
+            self.row_sums[source] = self.weights[
+                graph.indptr[source] : graph.indptr[source + 1]
+            ].sum()
+
+    def sync(self, state: GameState):
+        """
+        Catch up with the status changes of `state`, rebuilding everything only if the brain
+        follows another world or most of the statuses differ
+        """
+        if self._state is None or state.world is not self._state.world:
+            self._rebuild(state)
+            return
+        changes = None
+        if state is self._state and state.epoch == self._epoch:
+            changes = state.changes_since(self._changes_read)
+        if changes is None:
+            # a clone, a restored turn or a log trimmed past what was read
+            changed = np.flatnonzero(self._status != state.status)
+            if len(changed) > DRACULA_SYNC_REBUILD_FRACTION * len(state.graph):
+                self._rebuild(state)
+                return
+        else:
+            changed = np.unique(np.asarray(changes, dtype=np.int64))
+        for airport in changed:
+            self._update(state.graph, state, airport)
+        self._status[changed] = state.status[changed]
+        self._follow(state)
+
+    def transition_matrix(self, state: GameState):
+        """
+        :returns: A sparse matrix with the probability of Dracula flying from the airport of the
+        row to the airport of the column
+        """
+        from scipy.sparse import csr_matrix
+
+        self.sync(state)
+        graph = state.graph
+        with np.errstate(divide="ignore", invalid="ignore"):
+            probabilities = self.weights / self.row_sums[graph.edge_sources]
+        return csr_matrix(
+            (probabilities, graph.indices, graph.indptr), shape=(len(graph), len(graph))
+        )
+
     def list_moves(self, state: GameState, location: int) -> list[tuple[float, int]]:
         """
         :param state: Takes the current state of the game
@@ -13,16 +119,21 @@ class DraculaBrain:
         :return: A list of tuples in which elements consist of weight(float)
         and the index of the neighbouring airport
         """
-        weighted = []
-        neighbours = state.graph[location]
-        for neighbour in neighbours:
-            w = 1
-            if state.states[neighbour].status == AirportStatus.DESTROYED:
-                w = 1 / len(neighbours)
-            if state.states[neighbour].status == AirportStatus.TRAPPED:
-                w = 1.2
-            weighted.append(w)
-        weight_total = sum(weighted)
-        weighted = [w / weight_total for w in weighted]
-
-        return list(zip(weighted, state.graph[location]))
+        self.sync(state)
+        begin, end = state.graph.indptr[location], state.graph.indptr[location + 1]
+        weighted = self.weights[begin:end] / self.row_sums[location]
+
+        return list(zip(weighted.tolist(), state.graph.indices[begin:end].tolist()))
+
+    def choose_move(
+        self, state: GameState, location: int, rng: np.random.Generator
+    ) -> int:
+        """
+        :param rng: The generator to draw the move from
+        :return: The index of the airport dracula moves to, see `list_moves`
+        """
+        self.sync(state)
+        begin, end = state.graph.indptr[location], state.graph.indptr[location + 1]
+        cumulative = np.cumsum(self.weights[begin:end])
+        pick = np.searchsorted(cumulative, rng.random() * cumulative[-1], side="right")
+        return int(state.graph.indices[begin + min(pick, end - begin - 1)])
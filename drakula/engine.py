@@ -0,0 +1,209 @@
+from concurrent.futures import Future
+from enum import Enum
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from .dracula import DraculaBrain
+from .logging import logger
+from .state import GameState, AirportStatus
+
+# The game is lost once more than this share of the airports was destroyed
+WORLD_DESTROYED_THRESHOLD_PERCENT = 50
+
+
+# TODO: bad name, rename me?
+class GameOverKind(Enum):
+    WIN = 0
+    LOSS_CAUGHT = 1
+    LOSS_DESTROYED = 2
+
+
+class PlayerActionKind(Enum):
+    MOVE = 0
+    WAIT = 1
+    TRAP = 2
+
+
+class PlayerAction(NamedTuple):
+    kind: PlayerActionKind
+    # index of the airport to move to, only used by `PlayerActionKind.MOVE`
+    target: int = -1
+
+    @classmethod
+    def move(cls, target: int) -> "PlayerAction":
+        return cls(PlayerActionKind.MOVE, int(target))
+
+    @classmethod
+    def wait(cls) -> "PlayerAction":
+        return cls(PlayerActionKind.WAIT)
+
+    @classmethod
+    def trap(cls) -> "PlayerAction":
+        return cls(PlayerActionKind.TRAP)
+
+
+class StepResult(NamedTuple):
+    # False if the action was against the rules, nothing changed then
+    accepted: bool
+    # True if the action ended the turn of the player and Dracula had his
+    turn_taken: bool
+    outcome: Optional[GameOverKind]
+
+
+class GameEngine:
+    """
+    The rules of the game, without any rendering or input handling. A game is played by
+    passing the actions of the player to `step` until `outcome` is set.
+
+    Brains which think in the background leave the turn open after `step`, it is finished by
+    `poll` once Dracula decided. No actions are accepted meanwhile.
+
+    :param state: The game to play, modified in place
+    :param brain: Picks the moves of Dracula
+    :param seed: Seed of the generator used for the moves of Dracula
+    """
+
+    def __init__(
+        self,
+        state: GameState,
+        brain: Optional[DraculaBrain] = None,
+        seed: Optional[int] = None,
+    ):
+        self.state = state
+        self.brain = brain or DraculaBrain()
+        self.rng = np.random.default_rng(seed)
+        self.turn = 0
+        self.outcome: Optional[GameOverKind] = None
+        self._pending_move: Optional[Future] = None
+
+    @property
+    def thinking(self) -> bool:
+        """
+        :returns: True while Dracula is deciding on his move in the background
+        """
+        return self._pending_move is not None
+
+    @property
+    def destroyed_percent(self) -> int:
+        return round(100 * len(self.state.destroyed_airports) / len(self.state.airports))
+
+    def can_move_to(self, target: int) -> bool:
+        state = self.state
+        return bool(
+            target in state.graph
+            and target in state.graph[state.player_location]
+            and (
+                state.status[target] == AirportStatus.AVAILABLE
+                or target == state.dracula_location
+            )
+        )
+
+    def legal_moves(self) -> np.ndarray:
+        """
+        :returns: The airports the player may fly to this turn
+        """
+        state = self.state
+        neighbours = state.graph[state.player_location]
+        return neighbours[
+            (state.status[neighbours] == AirportStatus.AVAILABLE)
+            | (neighbours == state.dracula_location)
+        ]
+
+    def step(self, action: PlayerAction) -> StepResult:
+        """
+        Apply an action of the player. Moving and waiting end the turn, setting a trap does not.
+        """
+        if self.outcome is not None:
+            return StepResult(False, False, self.outcome)
+        if self.thinking:
+            logger.info("Dracula is still thinking")
+            return StepResult(False, False, None)
+
+        state = self.state
+        if action.kind == PlayerActionKind.TRAP:
+            if state.trap_count == 0:
+                logger.info(f"Trapping rejected {state.player_location}, 0 traps left")
+                return StepResult(False, False, None)
+            if state.status[state.player_location] != AirportStatus.AVAILABLE:
+                logger.info(
+                    f"May not trap {state.player_location}, already trapped or destroyed"
+                )
+                return StepResult(False, False, None)
+            state.trap_count -= 1
+            state.trap_location(state.player_location)
+            logger.info(
+                f"Trapped {state.player_location} successful, {state.trap_count} traps left"
+            )
+            return StepResult(True, False, None)
+
+        if action.kind == PlayerActionKind.MOVE:
+            if not self.can_move_to(action.target):
+                logger.info("Rejected attempt to go to an unavailable airport")
+                return StepResult(False, False, None)
+            logger.info(
+                f"Character moves from {state.airports[state.player_location].ident} to {state.airports[action.target].ident}"
+            )
+            state.player_location = action.target
+        else:
+            logger.info("Waiting for a turn")
+
+        self._resolve_turn()
+        return StepResult(True, True, self.outcome)
+
+    def poll(self) -> bool:
+        """
+        Finish the turn if Dracula decided on his move in the background
+
+        :returns: True if a turn was finished
+        """
+        if self._pending_move is None or not self._pending_move.done():
+            return False
+        self.finish_turn()
+        return True
+
+    def finish_turn(self):
+        """
+        Wait for Dracula to decide if he is thinking in the background and finish the turn, so
+        the state is not left between the moves of the player and Dracula
+        """
+        if self._pending_move is None:
+            return
+        move = self._pending_move.result()
+        self._pending_move = None
+        self._move_dracula(move)
+        self._check_outcome()
+
+    def _resolve_turn(self):
+        state = self.state
+        self.turn += 1
+        if state.dracula_location == state.player_location:
+            self.outcome = GameOverKind.WIN
+            return
+
+        state.tick_trap_timer()
+        if not state.dracula_on_trap():
+            if self.brain.asynchronous:
+                self._pending_move = self.brain.submit(state, state.dracula_location, self.rng)
+                return
+            self._move_dracula(
+                self.brain.choose_move(state, state.dracula_location, self.rng)
+            )
+        self._check_outcome()
+
+    def _move_dracula(self, location: int):
+        state = self.state
+        previous_location = state.dracula_location
+        state.destroy(previous_location)
+        state.dracula_location = location
+        state.dracula_trail.append(location)
+        logger.info(
+            f"Dracula moves from {state.airports[previous_location].ident} to {state.airports[location].ident}"
+        )
+
+    def _check_outcome(self):
+        state = self.state
+        if state.dracula_location == state.player_location:
+            self.outcome = GameOverKind.LOSS_CAUGHT
+        elif self.destroyed_percent > WORLD_DESTROYED_THRESHOLD_PERCENT:
+            self.outcome = GameOverKind.LOSS_DESTROYED
@@ -1,17 +1,21 @@
 import pygame
 from pygame.event import Event
-from enum import Enum
-from typing import Optional, List, NoReturn, Union
+from typing import Optional, List
 
 import numpy as np
 
-from .renderer import Renderer
+from .renderer import Renderer, RenderLayer
 from .scene import Scene
 from .state import GameState, AirportStatus
+from .belief import BeliefTracker
 from .character import Character
+from .engine import GameOverKind
+from .world import StartupProgress
 
 MAP_SCROLL_ACCELERATION_COEFFICIENT = 21
 MAP_SCROLL_SPEED_PERCENT_PER_S = 25
+# Slower than this, the map counts as resting
+MAP_SCROLL_RESTING_SPEED = 0.001
 
 AIRPORT_COLOR = pygame.Color(255, 70, 70)
 AIRPORT_TRAPPED_COLOR = pygame.Color(255, 255, 0)
@@ -27,30 +31,88 @@ ICAO_INPUT_WIDTH = 300
 ICAO_INPUT_HEIGHT = 40
 ICAO_INPUT_PADDING = 5
 ICAO_STATUS_PADDING = 10
+ICAO_COMPLETION_COLOR = pygame.Color(255, 255, 255)
+ICAO_COMPLETION_LIMIT = 8
 
 ICAO_AIRPORT_SCREEN_RADIUS = 0.01
 ICAO_AIRPORT_PLAYER_RADIUS = 0.01
+ICAO_AIRPORT_HIGHLIGHT_RADIUS = 0.005
+
+BELIEF_HEATMAP_COLOR = pygame.Color(170, 0, 255)
+BELIEF_HEATMAP_MAX_RADIUS = 0.04
+# Airports less likely than this share of the likeliest one are not drawn
+BELIEF_HEATMAP_MIN_SHARE = 0.02
+
+LOADING_BAR_COLOR = pygame.Color(255, 215, 0)
+LOADING_BAR_BACKGROUND_COLOR = pygame.Color(0, 0, 0, 200)
+LOADING_BAR_WIDTH = 0.4
+LOADING_BAR_HEIGHT = 0.02
+
+
+class LoadingScene(Scene):
+    """
+    Shown while the world is generated in the background
+    """
+
+    def __init__(self, progress: StartupProgress) -> None:
+        super().__init__()
+        self.progress = progress
+
+    def render(self, renderer: Renderer):
+        bar_position = np.array([0.5 - LOADING_BAR_WIDTH / 2, 0.5])
+        bar_rect = pygame.Rect(
+            *renderer.project(bar_position),
+            *renderer.project((LOADING_BAR_WIDTH, LOADING_BAR_HEIGHT)),
+        )
+        renderer.ui_layer.draw_rect(LOADING_BAR_BACKGROUND_COLOR, bar_rect)
+        filled_rect = bar_rect.copy()
+        filled_rect.width = round(bar_rect.width * self.progress.fraction)
+        renderer.ui_layer.draw_rect(LOADING_BAR_COLOR, filled_rect)
+
+        text = renderer.render_text(f"{self.progress.stage}...", 24, (255, 255, 255))
+        text_rect = text.get_rect(midbottom=(bar_rect.centerx, bar_rect.top - 10))
+        renderer.text_layer.blit(text, text_rect)
 
 
 class MapScene(Scene):
-    def __init__(self, state: GameState, character: Character) -> None:
+    def __init__(
+        self,
+        state: GameState,
+        character: Character,
+        belief: Optional[BeliefTracker] = None,
+    ) -> None:
         super().__init__()
 
         self.state = state
 
         self.character = character
 
+        # toggled with F2
+        self.belief = belief
+        self.show_belief = False
+
+        # batches drawn by the GPU, created with the first frame
+        self._edges = None
+        self._markers = None
+        self._heatmap = None
+        self._heatmap_belief = None
+        self._network_graph = None
+        self._network_key = None
+        self._edge_sources = self._edge_targets = None
+        # retained layers, drawn anew only when what they show changed
+        self._labels = None
+        self._hud = None
+
         self.horizontal_scroll_px = 0
         self.current_scroll_speed = 0
         self.target_scroll_speed = 0
 
     def render(self, renderer: Renderer):
-        renderer.surface.fill((0, 0, 0, 0))
         self.update_scroll(renderer)
         self.scroll_world_map(renderer)
+        self.render_belief_heatmap(renderer)
         self.render_airport_network(renderer)
-        self.render_icao_input(renderer)
-        self.render_dracula_warning(renderer)
+        self.render_hud(renderer)
 
         super().render(renderer)
 
@@ -76,55 +138,103 @@ class MapScene(Scene):
     def scroll_world_map(self, renderer: Renderer):
         renderer.horizontal_scroll = self.normalized_horizontal_scroll(renderer)
 
-    def render_airport_network(self, renderer: Renderer):
-        def apply_scroll(arr):
-            normalized_scroll = self.normalized_horizontal_scroll(renderer)
-            return np.array([(arr[0] + normalized_scroll) % 1.0, arr[1]])
-
-        # Draw airport connections
-        for i, js in self.state.graph.items():
-            airport = self.state.airports[i]
-            a = apply_scroll(airport.screen_position)
-            for j in js:
-                connected_airports = self.state.airports[j]
-                b = apply_scroll(connected_airports.screen_position)
-
-                if (
-                    i == self.character.current_location
-                    or j == self.character.current_location
-                ):
-                    connection_color = AVAILABLE_AIRPORT_CONNECTION_COLOR
-                else:
-                    connection_color = AIRPORT_CONNECTION_COLOR
-
-                renderer.draw_line_wrapping(connection_color, a, b)
-
-        # Draw airport markers
-        for idx, state in enumerate(self.state.states):
-            p = apply_scroll(state.airport.screen_position)
-            point_color = AIRPORT_COLOR
-            if state.status == AirportStatus.TRAPPED:
-                point_color = AIRPORT_TRAPPED_COLOR
-            elif state.status == AirportStatus.DESTROYED:
-                point_color = AIRPORT_DESTROYED_COLOR
-            elif idx == self.character.current_location:
-                point_color = CURRENT_AIRPORT_HIGHLIGHT_COLOR
-
-            renderer.draw_circle(point_color, p, ICAO_AIRPORT_SCREEN_RADIUS)
-            if idx == self.character.current_location:
-                renderer.draw_circle(
-                    CURRENT_AIRPORT_HIGHLIGHT_COLOR, p, 0.005
-                )
+    def render_belief_heatmap(self, renderer: Renderer):
+        if not self.show_belief or self.belief is None:
+            return
+        if self._heatmap is None:
+            self._heatmap = renderer.create_marker_batch()
+        belief = self.belief.belief
+        if belief is not self._heatmap_belief:
+            self._heatmap_belief = belief
+            likeliest = belief.max(initial=0)
+            share = belief / likeliest if likeliest > 0 else np.zeros_like(belief)
+            (shown,) = np.nonzero(share >= BELIEF_HEATMAP_MIN_SHARE)
+            share = share[shown]
+
+            # the likelier, the larger and the more opaque
+            colors = np.tile(np.array(BELIEF_HEATMAP_COLOR, dtype=np.float32), (len(shown), 1))
+            colors[:, 3] = np.round(55 + 200 * share)
+            self._heatmap.set_markers(
+                self.state.airports.screen_positions[shown],
+                BELIEF_HEATMAP_MAX_RADIUS * np.sqrt(share),
+                colors,
+                np.zeros(len(shown)),
+            )
+        renderer.draw_batch(self._heatmap)
+
+    def update_airport_network(self, renderer: Renderer):
+        """
+        Upload the lines and markers of the network, only what changed since the previous frame
+        """
+        graph = self.state.graph
+        screen_positions = self.state.airports.screen_positions
+        current = self.character.current_location
+        if self._edges is None:
+            self._edges = renderer.create_edge_batch()
+            self._markers = renderer.create_marker_batch()
+        if self._network_graph is not graph:
+            self._network_graph = graph
+            self._network_key = None
+            # every edge once
+            sources = graph.edge_sources
+            once = sources < graph.indices
+            self._edge_sources, self._edge_targets = sources[once], graph.indices[once]
+            self._edges.set_geometry(
+                screen_positions[self._edge_sources], screen_positions[self._edge_targets]
+            )
 
+        if self.state.version == self._network_key:
+            return
+        self._network_key = self.state.version
+
+        available = (self._edge_sources == current) | (self._edge_targets == current)
+        self._edges.set_style(
+            np.where(
+                available[:, None],
+                np.array(AVAILABLE_AIRPORT_CONNECTION_COLOR),
+                np.array(AIRPORT_CONNECTION_COLOR),
+            ),
+            available,
+        )
+
+        status = self.state.status
+        # one marker per airport and the highlight of the current airport on top
+        colors = np.tile(np.array(AIRPORT_COLOR), (len(status) + 1, 1))
+        colors[current] = colors[-1] = CURRENT_AIRPORT_HIGHLIGHT_COLOR
+        colors[:-1][status == AirportStatus.TRAPPED] = AIRPORT_TRAPPED_COLOR
+        colors[:-1][status == AirportStatus.DESTROYED] = AIRPORT_DESTROYED_COLOR
+        radii = np.full(len(status) + 1, ICAO_AIRPORT_SCREEN_RADIUS)
+        radii[-1] = ICAO_AIRPORT_HIGHLIGHT_RADIUS
+        glow = np.zeros(len(status) + 1)
+        glow[-1] = 1
+        glow[current] = status[current] == AirportStatus.AVAILABLE
+        self._markers.set_markers(
+            np.concatenate([screen_positions, screen_positions[current : current + 1]]),
+            radii,
+            colors,
+            glow,
+        )
+
+    def render_airport_network(self, renderer: Renderer):
+        # Lines and markers are drawn by the GPU, scrolled by the shaders
+        self.update_airport_network(renderer)
+        renderer.draw_batch(self._edges)
+        renderer.draw_batch(self._markers)
+
+        # so are the labels, drawn once without the scroll
+        if self._labels is None:
+            self._labels = renderer.create_layer()
+        if self._labels.rebuild(self.state.version, renderer.size):
+            self.render_airport_labels(renderer, self._labels)
+        renderer.draw_layer(self._labels, text=True, scrolled=True)
+
+    def render_airport_labels(self, renderer: Renderer, layer: RenderLayer):
         current_player_airport = self.state.airports[self.character.current_location]
         connected_airports = self.state.graph[self.character.current_location]
-        airport_icao_name_font = renderer.font(18)
 
         for i, idx in enumerate(connected_airports):
             airport = self.state.airports[idx]
-            icao_text_surface = airport_icao_name_font.render(
-                airport.ident, True, (255, 255, 255)
-            )
+            icao_text_surface = renderer.render_text(airport.ident, 18, (255, 255, 255))
             airport_position_px = renderer.project(airport.screen_position)
             airport_position_px -= np.array(icao_text_surface.get_size()) / 2
 
@@ -135,14 +245,24 @@ class MapScene(Scene):
             direction_normalized = direction / np.linalg.norm(direction)
 
             airport_position_screen += direction_normalized * ICAO_AIRPORT_SCREEN_RADIUS
-            airport_position_px = renderer.project(
-                apply_scroll(airport_position_screen)
-            )
+            airport_position_screen[0] %= 1.0
+            # once more a screen further left, where the layer wraps around while scrolling
+            for wrap in (0, -1):
+                layer.blit(
+                    icao_text_surface,
+                    renderer.project(airport_position_screen + (wrap, 0)),
+                )
 
-            renderer.text_surface.blit(icao_text_surface, airport_position_px)
+    def render_hud(self, renderer: Renderer):
+        if self._hud is None:
+            self._hud = renderer.create_layer()
+        key = (self.state.version, self.character.input_text)
+        if self._hud.rebuild(key, renderer.size):
+            self.render_icao_input(renderer, self._hud)
+            self.render_dracula_warning(renderer, self._hud)
+        renderer.draw_layer(self._hud)
 
-    def render_icao_input(self, renderer: Renderer):
-        font = renderer.font(18)
+    def render_icao_input(self, renderer: Renderer, layer: RenderLayer):
         input_rect = pygame.Rect(0, 0, 0, 0)
         input_rect.bottomleft = (
             ICAO_INPUT_PADDING,
@@ -151,17 +271,37 @@ class MapScene(Scene):
         input_rect.width = ICAO_INPUT_WIDTH
         input_rect.height = ICAO_INPUT_HEIGHT
 
-        current_airport = self.state.states[self.character.current_location].airport
+        current_airport = self.state.airports[self.character.current_location]
 
-        pygame.draw.rect(renderer.surface, ICAO_INPUT_COLOR, input_rect)
-        input_text = font.render(
-            f"Enter ICAO: {self.character.input_text}", True, (0, 0, 0)
+        layer.draw_rect(ICAO_INPUT_COLOR, input_rect)
+        input_text = renderer.render_text(
+            f"Enter ICAO: {self.character.input_text}", 18, (0, 0, 0)
         )
-        renderer.surface.blit(
+        layer.blit(
             input_text,
             (input_rect.x + ICAO_INPUT_PADDING, input_rect.y + ICAO_INPUT_PADDING),
         )
 
+        if self.character.input_text:
+            completions = self.state.neighbour_trie(
+                self.character.current_location
+            ).complete(self.character.input_text)
+            candidates = ", ".join(ident for ident, _ in completions[:ICAO_COMPLETION_LIMIT])
+            if len(completions) > ICAO_COMPLETION_LIMIT:
+                candidates += ", ..."
+            completion_text = renderer.render_text(
+                f"Tab: {candidates}" if completions else "No such connection",
+                18,
+                ICAO_COMPLETION_COLOR,
+            )
+            layer.blit(
+                completion_text,
+                (
+                    input_rect.x + ICAO_INPUT_PADDING,
+                    input_rect.y - ICAO_INPUT_PADDING - completion_text.get_height(),
+                ),
+            )
+
         connected_airports = ",".join(
             self.state.airports[i].ident
             for i in self.state.graph[self.character.current_location]
@@ -174,7 +314,7 @@ class MapScene(Scene):
             f"Connected: {connected_airports}",
         ]
 
-        status_text = font.render(" | ".join(status_elements), True, (255, 255, 255))
+        status_text = renderer.render_text(" | ".join(status_elements), 18, (255, 255, 255))
 
         status_rect = pygame.Rect(
             0,
@@ -186,22 +326,21 @@ class MapScene(Scene):
             (status_rect.width, status_rect.height), pygame.SRCALPHA
         )
         status_surface.fill(ICAO_STATUS_BAR_COLOR)
-        renderer.surface.blit(status_surface, status_rect)
-        renderer.surface.blit(status_text, (ICAO_STATUS_PADDING, ICAO_STATUS_PADDING))
+        layer.blit(status_surface, status_rect)
+        layer.blit(status_text, (ICAO_STATUS_PADDING, ICAO_STATUS_PADDING))
 
-    def render_dracula_warning(self, renderer: Renderer):
+    def render_dracula_warning(self, renderer: Renderer, layer: RenderLayer):
         if not self.state.is_dracula_near_trap() and not self.state.dracula_on_trap():
             return
         if self.state.dracula_on_trap():
             warning_message = "Dracula is trapped on one of the traps"
         else:
             warning_message = "Your traps sense a spooky presence"
-        font = renderer.font(36)
-        text_surface = font.render(warning_message, True, (255, 0, 0))
+        text_surface = renderer.render_text(warning_message, 36, (255, 0, 0))
         text_width, text_height = np.array([*text_surface.get_size()]) / renderer.size
         text_x = 1 - text_width
         text_y = 1 - text_height
-        renderer.blit(text_surface, (text_x, text_y))
+        layer.blit(text_surface, renderer.project((text_x, text_y)))
 
     def handle_event(self, event: Event) -> bool:
         self.target_scroll_speed = 0
@@ -210,28 +349,33 @@ class MapScene(Scene):
                 self.target_scroll_speed += 1
             if event.key == pygame.K_RIGHT:
                 self.target_scroll_speed -= 1
+            if event.key == pygame.K_F2 and self.belief is not None:
+                self.show_belief = not self.show_belief
+                return True
 
         # lazy evaluation ftw
         # https://docs.python.org/2/reference/expressions.html#boolean-operations
         return bool(self.target_scroll_speed) or super().handle_event(event)
 
+    @property
+    def animating(self) -> bool:
+        return (
+            self.target_scroll_speed != 0
+            or abs(self.current_scroll_speed) > MAP_SCROLL_RESTING_SPEED
+        )
+
     def normalized_horizontal_scroll(self, renderer) -> float:
         return self.horizontal_scroll_px / renderer.size[0]
 
 
-# TODO: bad name, rename me?
-class GameOverKind(Enum):
-    WIN = 0
-    LOSS_CAUGHT = 1
-    LOSS_DESTROYED = 2
-
-
 class GameOverScene(Scene):
     def __init__(self, previous_scene: Scene, kind: GameOverKind,state: Optional[GameState] = None):
         super().__init__()
         self.previous_scene = previous_scene
         self.result_kind = kind
         self.state = state or getattr(previous_scene, 'state', None)
+        # the dialog does not change, it is drawn anew only when the window is resized
+        self._dialog = None
 
     def wrap_text(self, text: str, font: pygame.font.Font, max_width: int) -> List[str]:
         words = text.split()
@@ -253,11 +397,14 @@ class GameOverScene(Scene):
 
     def render(self, renderer: Renderer):
         self.previous_scene.render(renderer)
-        self.display_result(renderer)
+        if self._dialog is None:
+            self._dialog = renderer.create_layer()
+        if self._dialog.rebuild(self.result_kind, renderer.size):
+            self.display_result(renderer, self._dialog)
+        renderer.draw_layer(self._dialog, text=True)
 
-    def display_result(self, renderer: Renderer):
-        result_font = renderer.font(40)
-        option_font =  renderer.font(20)
+    def display_result(self, renderer: Renderer, layer: RenderLayer):
+        option_font = renderer.font(20)
 
         box_width, box_height = 700, 350
         screen_width, screen_height = renderer.surface.get_size()
@@ -267,16 +414,16 @@ class GameOverScene(Scene):
         pygame.draw.rect(box_surface, (0, 0, 0, 200), box_surface.get_rect(), border_radius=20)
 
         if self.result_kind == GameOverKind.WIN:
-            result_text = result_font.render("You Caught Dracula!", True, (0, 255, 0))
+            result_text = renderer.render_text("You Caught Dracula!", 40, (0, 255, 0))
         elif self.result_kind == GameOverKind.LOSS_CAUGHT:
-            result_text = result_font.render("You got caught!", True, (255, 0, 0))
+            result_text = renderer.render_text("You got caught!", 40, (255, 0, 0))
         elif self.result_kind == GameOverKind.LOSS_DESTROYED:
-            result_text = result_font.render("The world was destroyed!", True, (255, 0, 0))
+            result_text = renderer.render_text("The world was destroyed!", 40, (255, 0, 0))
 
         result_rect = result_text.get_rect(center= (box_width // 2, box_height // 3))
         box_surface.blit(result_text, result_rect)
 
-        title_text = option_font.render("Dracula Destroyed Airports:", True, (255, 215, 0))
+        title_text = renderer.render_text("Dracula Destroyed Airports:", 20, (255, 215, 0))
         title_rect = title_text.get_rect(midtop=(box_width // 2, result_rect.bottom - 5))
         box_surface.blit(title_text, title_rect)
 
@@ -292,16 +439,22 @@ class GameOverScene(Scene):
             y_position = box_height // 2
             line_spacing = 5
             for line in wrapped_lines:
-                options_text = option_font.render(line, True, (0, 0, 255))
+                options_text = renderer.render_text(line, 20, (0, 0, 255))
                 options_rect = options_text.get_rect(midtop=(box_width // 2, y_position))
                 box_surface.blit(options_text, options_rect)
                 y_position += options_text.get_height() + line_spacing
 
         border_rect = box_surface.get_rect()
         pygame.draw.rect(box_surface, (255, 215, 0), border_rect, width=1, border_radius=20)
-        renderer.text_surface.blit(box_surface, (box_x, box_y))
+        layer.blit(box_surface, (box_x, box_y))
+
+    @property
+    def animating(self) -> bool:
+        return self.previous_scene.animating
 
-    def handle_event(self, event: pygame.event.Event) -> Union[NoReturn, bool]:
+    def handle_event(self, event: pygame.event.Event) -> bool:
         if event.type == pygame.KEYDOWN:
-            exit(0)
+            # the main loop ends the game, so it gets to clean up behind it
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+            return True
         return False
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from typing import Iterator
+
+import numpy as np
+
+HOP_ROW_CACHE_SIZE = 256
+
+
+class AirportGraph:
+    """
+    Undirected airport connections in compressed sparse row form: the neighbours of vertex
+    `v` are `indices[indptr[v]:indptr[v + 1]]`, sorted ascending.
+
+    Hop distances are computed lazily by breadth-first search, the most recently used rows
+    are cached. Once the all-pairs matrix was requested, rows are served from it instead.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.indptr.flags.writeable = False
+        self.indices.flags.writeable = False
+        self._hop_matrix = None
+        self._edge_sources = None
+        self._reverse_edges = None
+        self._hop_rows: OrderedDict[int, np.ndarray] = OrderedDict()
+
+    @classmethod
+    def from_edges(cls, sources: np.ndarray, targets: np.ndarray, n: int) -> "AirportGraph":
+        """
+        :param sources: Source of every directed edge, sorted
+        :param targets: Target of every directed edge, sorted within each source
+        :param n: The amount of vertices
+        """
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+        return cls(indptr, targets)
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def __contains__(self, vertex) -> bool:
+        return 0 <= vertex < len(self)
+
+    def __getitem__(self, vertex: int) -> np.ndarray:
+        return self.neighbours(vertex)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def items(self) -> Iterator[tuple[int, np.ndarray]]:
+        for vertex in range(len(self)):
+            yield vertex, self.neighbours(vertex)
+
+    def neighbours(self, vertex: int) -> np.ndarray:
+        return self.indices[self.indptr[vertex] : self.indptr[vertex + 1]]
+
+    @property
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    @property
+    def edge_sources(self) -> np.ndarray:
+        """
+        :returns: The source of every edge, aligned with `indices`. Computed on first use, must
+        not be modified.
+        """
+        if self._edge_sources is None:
+            self._edge_sources = np.repeat(np.arange(len(self)), self.degrees)
+            self._edge_sources.flags.writeable = False
+        return self._edge_sources
+
+    @property
+    def reverse_edges(self) -> np.ndarray:
+        """
+        :returns: For every edge the position of the edge in the opposite direction, aligned
+        with `indices`. Computed on first use, must not be modified.
+        """
+        if self._reverse_edges is None:
+            n = len(self)
+            # edges are sorted by source and then target, so their encodings are sorted too
+            encoded = self.edge_sources * n + self.indices
+            self._reverse_edges = np.searchsorted(encoded, self.indices * n + self.edge_sources)
+            self._reverse_edges.flags.writeable = False
+        return self._reverse_edges
+
+    def edges_of(self, vertices: np.ndarray) -> np.ndarray:
+        """
+        :returns: The positions in `indices` of the edges leaving `vertices`, grouped by vertex
+        """
+        vertices = np.asarray(vertices, dtype=np.int64)
+        begins, ends = self.indptr[vertices], self.indptr[vertices + 1]
+        counts = ends - begins
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(begins, counts) + offsets
+
+    def neighbours_of(self, vertices: np.ndarray) -> np.ndarray:
+        """
+        :returns: The concatenated neighbours of all `vertices`, with repetitions
+        """
+        return self.indices[self.edges_of(vertices)]
+
+    def _breadth_first_search(self, source: int) -> np.ndarray:
+        distances = np.full(len(self), -1, dtype=np.int32)
+        distances[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        hops = 0
+        while len(frontier):
+            hops += 1
+            reached = self.neighbours_of(frontier)
+            frontier = np.unique(reached[distances[reached] < 0])
+            distances[frontier] = hops
+        return distances
+
+    def hop_distance_matrix(self) -> np.ndarray:
+        """
+        :returns: An (n, n) matrix of the amount of flights between every two airports, -1 if
+        there is no route. Computed on first use, must not be modified.
+        """
+        if self._hop_matrix is None:
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.csgraph import shortest_path
+
+            adjacency = csr_matrix(
+                (np.ones(len(self.indices), dtype=np.int8), self.indices, self.indptr),
+                shape=(len(self), len(self)),
+            )
+            distances = shortest_path(adjacency, unweighted=True, directed=False)
+            distances[np.isinf(distances)] = -1
+            # most worlds have a diameter way below 127 hops
+            dtype = np.int8 if distances.max(initial=0) < np.iinfo(np.int8).max else np.int32
+            self._hop_matrix = distances.astype(dtype)
+            self._hop_matrix.flags.writeable = False
+        return self._hop_matrix
+
+    def hop_distances(self, source: int) -> np.ndarray:
+        """
+        :returns: The amount of flights from `source` to every airport, -1 if unreachable.
+        Must not be modified.
+        """
+        if self._hop_matrix is not None:
+            return self._hop_matrix[source]
+
+        if source in self._hop_rows:
+            self._hop_rows.move_to_end(source)
+            return self._hop_rows[source]
+        row = self._breadth_first_search(source)
+        row.flags.writeable = False
+        self._hop_rows[source] = row
+        if len(self._hop_rows) > HOP_ROW_CACHE_SIZE:
+            self._hop_rows.popitem(last=False)
+        return row
+
+    def hop_distance(self, a: int, b: int) -> int:
+        """
+        :returns: The least amount of flights from `a` to `b`, -1 if there is no route
+        """
+        return int(self.hop_distances(a)[b])
+
+    def within_hops(self, vertex: int, hops: int) -> np.ndarray:
+        """
+        :returns: All vertices at most `hops` flights away from `vertex`, including itself
+        """
+        distances = self.hop_distances(vertex)
+        return np.flatnonzero((distances >= 0) & (distances <= hops))
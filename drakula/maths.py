@@ -1,7 +1,4 @@
 import numpy as np
-from math import atan, cos, sin, tan
-
-from scipy.spatial import Delaunay
 
 Rad = float
 Deg = float
@@ -28,7 +25,8 @@ def geodesic_to_3d_pos(
     flattening: float = 1 / 298.25,
 ) -> np.ndarray:
     """
-    Convert latitude and longitude to coordinates on a sphere.
+    Convert latitude and longitude to coordinates on a sphere. Also accepts arrays of points,
+    in which case an (n, 3) array is returned.
 
     :param lat_deg: north-south position of a point (from -90 at south to +90 at north).
     :param lon_deg: east-west position of a point relative to the prime meridian
@@ -46,14 +44,14 @@ def geodesic_to_3d_pos(
     lat = lat_deg * np.pi / 180.0
     lon = lon_deg * np.pi / 180.0
     alt = alt_ft
-    l = atan((1 - flattening) ** 2 * tan(lat))
+    l = np.arctan((1 - flattening) ** 2 * np.tan(lat))
     r = EARTH_RADIUS
 
-    x = r * cos(l) * cos(lon) + alt * cos(lat) * cos(lon)
-    y = r * cos(l) * sin(lon) + alt * cos(lat) * sin(lon)
-    z = r * sin(l) + alt * sin(lat)
+    x = r * np.cos(l) * np.cos(lon) + alt * np.cos(lat) * np.cos(lon)
+    y = r * np.cos(l) * np.sin(lon) + alt * np.cos(lat) * np.sin(lon)
+    z = r * np.sin(l) + alt * np.sin(lat)
 
-    return np.array([x, y, z])
+    return np.stack([x, y, z], axis=-1)
 
 # https://en.wikipedia.org/wiki/Spherical_coordinate_system#Cartesian_coordinates
 def x_y_to_geo_pos_deg(x, y):
@@ -69,7 +67,13 @@ def x_y_to_geo_pos_deg(x, y):
 
 def delaunay_triangulate_points(points):
     """
+    For points on a sphere the triangles of their convex hull are exactly their spherical
+    Delaunay triangulation, so the hull is computed directly instead of tetrahedralizing.
+
     :param: coordinates of the points in 3D space
-    :return: the convex hull of the points
+    :return: the triangles of the convex hull of the points
     """
-    return Delaunay(points).convex_hull
+    # scipy takes longer to import than the rest of the game, only pay for it when needed
+    from scipy.spatial import ConvexHull
+
+    return ConvexHull(points).simplices
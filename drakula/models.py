@@ -8,6 +8,18 @@ from pydantic import BaseModel, PositiveInt, field_validator
 from drakula.maths import geo_pos_to_screen_pos
 
 
+# Wide columns the game never reads, they are not selected from the database
+AIRPORT_UNUSED_COLUMNS = (
+    "iso_region",
+    "municipality",
+    "scheduled_service",
+    "gps_code",
+    "iata_code",
+    "local_code",
+    "home_link",
+)
+
+
 class Airport(BaseModel):
     """
     Contains all the information related to the airport provided from the database
@@ -21,13 +33,13 @@ class Airport(BaseModel):
     elevation_ft: int
     continent: str
     iso_country: str
-    iso_region: str
-    municipality: str
-    scheduled_service: str
-    gps_code: str
-    iata_code: str
-    local_code: str
-    home_link: str
+    iso_region: str = ""
+    municipality: str = ""
+    scheduled_service: str = ""
+    gps_code: str = ""
+    iata_code: str = ""
+    local_code: str = ""
+    home_link: str = ""
 
     @property
     def geo_position(self) -> NDArray[(2,)]:
@@ -61,3 +73,168 @@ class Airport(BaseModel):
         if not value:
             return 0
         return value
+
+
+class AirportTable:
+    """
+    Struct-of-arrays storage for a list of airports. The coordinates live in contiguous
+    float64 arrays, all other columns are kept as plain lists of strings.
+
+    The arrays may be read freely, but coordinates must only be changed through
+    `set_geo_positions`, `correct_geo_positions` or the `AirportView` setters, since the screen
+    positions are cached and only recomputed after one of those.
+    """
+
+    def __init__(
+        self,
+        id: NDArray,
+        latitude_deg: NDArray,
+        longitude_deg: NDArray,
+        elevation_ft: NDArray,
+        strings: dict[str, list[str]],
+    ):
+        self.id = np.array(id, dtype=np.int64)
+        self.latitude_deg = np.array(latitude_deg, dtype=np.float64)
+        self.longitude_deg = np.array(longitude_deg, dtype=np.float64)
+        self.elevation_ft = np.array(elevation_ft, dtype=np.float64)
+        self.strings = {name: list(values) for name, values in strings.items()}
+        self._screen_positions = None
+
+    @classmethod
+    def from_airports(cls, airports: list[Airport]) -> "AirportTable":
+        numeric = ("id", "latitude_deg", "longitude_deg", "elevation_ft")
+        return cls(
+            *(np.array([getattr(a, name) for a in airports]) for name in numeric),
+            strings={
+                name: [getattr(a, name) for a in airports]
+                for name in Airport.model_fields
+                if name not in numeric
+            },
+        )
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def __getitem__(self, index: int) -> "AirportView":
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Airport {index} out of range")
+        return AirportView(self, int(index) % len(self))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield AirportView(self, i)
+
+    def copy(self) -> "AirportTable":
+        return AirportTable(
+            self.id, self.latitude_deg, self.longitude_deg, self.elevation_ft, self.strings
+        )
+
+    @property
+    def geo_positions(self) -> NDArray:
+        """
+        :returns: An (n, 2) array of latitudes and longitudes
+        """
+        return np.column_stack((self.latitude_deg, self.longitude_deg))
+
+    @property
+    def screen_positions(self) -> NDArray:
+        """
+        :returns: A cached (n, 2) array of the positions of every airport on the screen, see
+        `Airport.screen_position`. Must not be modified.
+        """
+        if self._screen_positions is None:
+            self._screen_positions = np.ascontiguousarray(
+                geo_pos_to_screen_pos(self.latitude_deg, self.longitude_deg).T
+            )
+            self._screen_positions.flags.writeable = False
+        return self._screen_positions
+
+    def invalidate(self):
+        """Drop the cached values derived from the coordinates"""
+        self._screen_positions = None
+
+    def set_geo_positions(self, latitude_deg: NDArray, longitude_deg: NDArray):
+        self.latitude_deg[:] = latitude_deg
+        self.longitude_deg[:] = longitude_deg
+        self.invalidate()
+
+    def correct_geo_positions(self):
+        """Correct latitudes and longitudes to be within their respective ranges"""
+        latitude_deg = (self.latitude_deg + 90) % 180 - 90
+        longitude_deg = self.longitude_deg % 360.0
+        longitude_deg[longitude_deg > 180.0] -= 360
+        self.set_geo_positions(latitude_deg, longitude_deg)
+
+
+class AirportView:
+    """
+    A single row of an `AirportTable`, exposes the same attributes as `Airport`
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: AirportTable, index: int):
+        self.table = table
+        self.index = index
+
+    def __getattr__(self, name: str):
+        strings = self.table.strings
+        if name in strings:
+            return strings[name][self.index]
+        raise AttributeError(f"Airport has no attribute `{name}`")
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, AirportView)
+            and self.table is other.table
+            and self.index == other.index
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self.table), self.index))
+
+    @property
+    def id(self) -> int:
+        return int(self.table.id[self.index])
+
+    @property
+    def latitude_deg(self) -> float:
+        return float(self.table.latitude_deg[self.index])
+
+    @latitude_deg.setter
+    def latitude_deg(self, value: float):
+        self.table.latitude_deg[self.index] = value
+        self.table.invalidate()
+
+    @property
+    def longitude_deg(self) -> float:
+        return float(self.table.longitude_deg[self.index])
+
+    @longitude_deg.setter
+    def longitude_deg(self, value: float):
+        self.table.longitude_deg[self.index] = value
+        self.table.invalidate()
+
+    @property
+    def elevation_ft(self) -> float:
+        return float(self.table.elevation_ft[self.index])
+
+    @property
+    def geo_position(self) -> NDArray[(2,)]:
+        return np.array([self.latitude_deg, self.longitude_deg])
+
+    @property
+    def screen_position(self) -> NDArray[(2,)]:
+        """
+        :returns: A read-only row of `AirportTable.screen_positions`
+        """
+        return self.table.screen_positions[self.index]
+
+    def correct_geo_position(self):
+        """Correct latitude and longitude to be within their respective ranges"""
+        longitude_reduced = self.longitude_deg % 360.0
+        if longitude_reduced > 180.0:
+            longitude_reduced -= 360
+        self.table.latitude_deg[self.index] = (self.latitude_deg + 90) % 180 - 90
+        self.table.longitude_deg[self.index] = longitude_reduced
+        self.table.invalidate()
@@ -0,0 +1,147 @@
+import os
+from collections import deque
+from time import perf_counter
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pygame
+
+from .debug import is_debug_layer_enabled, DEBUG_LAYER_FRAME_STATS
+from .logging import logger
+
+FRAME_FPS_CAP = 144
+# While nothing animates, frames are shown this often or as soon as there is input
+FRAME_IDLE_FPS = 10
+# Statistics cover this many of the most recent frames
+FRAME_STATS_WINDOW = 600
+FRAME_STATS_REPORT_SECONDS = 5
+
+
+class PacingConfig(NamedTuple):
+    # 0 for no cap
+    fps_cap: float
+    # 0 to render idle frames like any other
+    idle_fps: float
+    # None to leave the swap interval to the driver
+    vsync: Optional[bool]
+
+
+def pacing_config() -> PacingConfig:
+    """
+    :returns: The pacing set in `DRAKULA_FPS_CAP`, `DRAKULA_IDLE_FPS` and `DRAKULA_VSYNC`
+    """
+    fps_cap = float(os.getenv("DRAKULA_FPS_CAP") or FRAME_FPS_CAP)
+    idle_fps = float(os.getenv("DRAKULA_IDLE_FPS") or FRAME_IDLE_FPS)
+    vsync = (os.getenv("DRAKULA_VSYNC") or "").strip().lower()
+    return PacingConfig(
+        max(fps_cap, 0),
+        max(idle_fps, 0),
+        vsync in ("1", "true", "yes") if vsync else None,
+    )
+
+
+class FrameStats(NamedTuple):
+    frames: int
+    # Time spent on a frame, without waiting for the next one
+    mean_ms: float
+    median_ms: float
+    p95_ms: float
+    max_ms: float
+    # Frames shown per second
+    fps: float
+
+
+class FrameScheduler:
+    """
+    Decides when the next frame is due and waits for it. Frames follow each other at most
+    `fps_cap` times per second. While nothing animates they are only shown `idle_fps` times
+    per second, waiting for events meanwhile so input is still handled right away. The shaders
+    animate the glow and the sun slowly enough to not count as animating.
+
+    :param fps_cap: 0 for no cap
+    :param idle_fps: 0 to not treat idle frames differently
+    """
+
+    def __init__(self, fps_cap: float = FRAME_FPS_CAP, idle_fps: float = FRAME_IDLE_FPS):
+        self.fps_cap = fps_cap
+        self.idle_fps = min(idle_fps, fps_cap) if fps_cap else idle_fps
+        self.frames = 0
+        self._frame_start = perf_counter()
+        self._last_report = self._frame_start
+        self.frame_times: deque[float] = deque(maxlen=FRAME_STATS_WINDOW)
+        self.intervals: deque[float] = deque(maxlen=FRAME_STATS_WINDOW)
+        self._report = is_debug_layer_enabled(DEBUG_LAYER_FRAME_STATS)
+
+    def wait(self, animating: bool = True):
+        """
+        Call once a frame was shown, returns when the next one is due
+
+        :param animating: Whether the next frame would differ from the shown one without any
+        input
+        """
+        now = perf_counter()
+        self.frame_times.append(now - self._frame_start)
+
+        if self.fps_cap:
+            cap_due = self._frame_start + 1 / self.fps_cap
+        else:
+            cap_due = now
+        if not animating and self.idle_fps:
+            idle_due = self._frame_start + 1 / self.idle_fps
+            if idle_due > now and self._wait_for_event(idle_due - now):
+                # input is handled right away, but not more often than the cap allows
+                self._sleep_until(cap_due)
+        else:
+            self._sleep_until(cap_due)
+
+        now = perf_counter()
+        self.intervals.append(now - self._frame_start)
+        self._frame_start = now
+        self.frames += 1
+        if self._report and now - self._last_report >= FRAME_STATS_REPORT_SECONDS:
+            self._last_report = now
+            self.log_stats()
+
+    @staticmethod
+    def _sleep_until(due: float):
+        remaining = due - perf_counter()
+        if remaining > 0:
+            pygame.time.wait(int(1000 * remaining))
+
+    @staticmethod
+    def _wait_for_event(seconds: float) -> bool:
+        """
+        :returns: True if an event arrived within `seconds`, it is left in the queue
+        """
+        event = pygame.event.wait(max(int(1000 * seconds), 1))
+        if event.type == pygame.NOEVENT:
+            return False
+        # whatever else arrived meanwhile goes back behind it, in order
+        for pending in [event, *pygame.event.get()]:
+            pygame.event.post(pending)
+        return True
+
+    def stats(self) -> FrameStats:
+        """
+        :returns: Statistics of the most recent `FRAME_STATS_WINDOW` frames
+        """
+        if not self.frame_times:
+            return FrameStats(0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        frame_times = np.array(self.frame_times) * 1000
+        intervals = np.array(self.intervals or [0.0])
+        return FrameStats(
+            len(frame_times),
+            float(frame_times.mean()),
+            float(np.median(frame_times)),
+            float(np.percentile(frame_times, 95)),
+            float(frame_times.max()),
+            float(1 / intervals.mean()) if intervals.mean() > 0 else 0.0,
+        )
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"{stats.fps:.1f} frames per second, frame times mean {stats.mean_ms:.2f}ms, "
+            f"median {stats.median_ms:.2f}ms, 95th percentile {stats.p95_ms:.2f}ms, "
+            f"max {stats.max_ms:.2f}ms"
+        )
@@ -0,0 +1,50 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from .debug import is_debug_layer_enabled, DEBUG_LAYER_STARTUP_PROFILE
+from .logging import logger
+
+
+class StartupProfile:
+    """
+    Collects how long each stage of the startup took and when the milestones were reached,
+    relative to the moment this module was first imported. Stages may overlap, since world
+    generation runs on a worker thread.
+    """
+
+    def __init__(self):
+        self.origin = perf_counter()
+        self.stages: dict[str, float] = defaultdict(float)
+        self.milestones: dict[str, float] = {}
+        self.reported = False
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] += seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, perf_counter() - start)
+
+    def mark(self, milestone: str):
+        """Remember when a milestone was first reached"""
+        self.milestones.setdefault(milestone, perf_counter() - self.origin)
+
+    def report(self):
+        """Log the profile once, if the startup profile debug layer is enabled"""
+        if self.reported:
+            return
+        self.reported = True
+        if not is_debug_layer_enabled(DEBUG_LAYER_STARTUP_PROFILE):
+            return
+        for stage, seconds in self.stages.items():
+            logger.info(f"Startup stage {stage}: {round(1000 * seconds, 1)}ms")
+        for milestone, seconds in sorted(self.milestones.items(), key=lambda x: x[1]):
+            logger.info(f"Startup milestone {milestone}: {round(1000 * seconds, 1)}ms")
+
+
+startup_profile = StartupProfile()
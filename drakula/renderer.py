@@ -1,5 +1,6 @@
+from collections import OrderedDict
 from datetime import datetime
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
 
 import moderngl
 import numpy as np
@@ -7,6 +8,7 @@ import pygame
 
 from .utils import load_shader, load_texture
 from .logging import logger
+from .profiling import startup_profile
 
 Coordinate = Tuple[float, float]
 
@@ -17,11 +19,271 @@ def should_wrap_coordinate(a: float, b: float, span: float) -> bool:
     return abs(wrapped_signed_distance) < abs(signed_distance)
 
 
+# Rendered texts kept around, a frame rarely shows more than a few dozen different ones
+TEXT_CACHE_SIZE = 256
+
 PYGAME_MODE_FLAGS = (
     pygame.OPENGL | pygame.RESIZABLE | pygame.HWSURFACE | pygame.DOUBLEBUF
 )
 
 
+def texture_swizzle(surface: pygame.Surface) -> str:
+    """
+    :returns: The swizzle of a texture holding the raw pixels of `surface`, so the shaders
+    see red, green, blue and alpha in that order regardless of how pygame stores them
+    """
+    return "".join("RGBA"[shift // 8] for shift in surface.get_shifts())
+
+
+class RenderLayer:
+    """
+    A surface drawn on by pygame and the texture it is shown with. The texture lives until the
+    size changes and only the part drawn into since the previous frame is written to it, a
+    layer nobody drew into is not uploaded at all.
+
+    Drawing has to go through the layer, or be reported with `mark`, to show up. Layers cleared
+    every frame are drawn anew every frame, retained ones keep what was drawn into them until
+    `rebuild` is called with a new key.
+    """
+
+    def __init__(self, ctx: "moderngl.Context", size: Tuple[int, int]):
+        self.ctx = ctx
+        self.surface = pygame.Surface(size, flags=pygame.SRCALPHA)
+        self.texture: Optional[moderngl.Texture] = None
+        self._drawn: list[pygame.Rect] = []
+        # drawn in the previous frame, erased by `clear`
+        self._previous: Optional[pygame.Rect] = None
+        self._cleared: Optional[pygame.Rect] = None
+        # everything drawn since the layer was last erased, see `rebuild`
+        self._content: Optional[pygame.Rect] = None
+        self._key = None
+
+    def resize(self, size: Tuple[int, int]):
+        self.surface = pygame.Surface(size, flags=pygame.SRCALPHA)
+        if self.texture is not None:
+            self.texture.release()
+            self.texture = None
+        self._drawn.clear()
+        self._previous = self._cleared = self._content = None
+
+    def rebuild(self, key, size: Tuple[int, int]) -> bool:
+        """
+        For retained layers, erase everything if `key` or the size changed since the previous
+        call
+
+        :returns: True if the layer was erased and has to be drawn anew
+        """
+        if key == self._key and self.surface.get_size() == tuple(size):
+            return False
+        self._key = key
+        if self.surface.get_size() != tuple(size):
+            self.resize(size)
+        elif self._content is not None:
+            self.surface.fill((0, 0, 0, 0), self._content)
+            self._cleared = self._content.union(self._cleared or self._content)
+            self._content = None
+        return True
+
+    def mark(self, rect: pygame.Rect) -> pygame.Rect:
+        """
+        Report drawing into `rect` which did not go through the layer
+        """
+        clipped = rect.clip(self.surface.get_rect())
+        if clipped.width and clipped.height:
+            self._drawn.append(clipped)
+        return rect
+
+    def blit(self, source: pygame.Surface, dest, area=None) -> pygame.Rect:
+        return self.mark(self.surface.blit(source, dest, area))
+
+    def draw_rect(self, color: pygame.Color, rect: pygame.Rect, **kwargs) -> pygame.Rect:
+        return self.mark(pygame.draw.rect(self.surface, color, rect, **kwargs))
+
+    def clear(self):
+        """
+        Erase what the previous frame drew, the rest is transparent already
+        """
+        if self._previous is not None:
+            self.surface.fill((0, 0, 0, 0), self._previous)
+        self._cleared, self._previous = self._previous, None
+        self._content = None
+
+    def upload(self):
+        """
+        Bring the texture up to date with the surface
+        """
+        drawn = self._drawn[0].unionall(self._drawn[1:]) if self._drawn else None
+        changed = [rect for rect in (drawn, self._cleared) if rect is not None]
+        self._drawn.clear()
+        self._previous, self._cleared = drawn, None
+        if drawn is not None:
+            self._content = drawn.union(self._content or drawn)
+
+        if self.texture is None:
+            self.texture = self.ctx.texture(self.surface.get_size(), 4)
+            self.texture.swizzle = texture_swizzle(self.surface)
+            changed = [self.surface.get_rect()]
+        if not changed:
+            return
+
+        region = changed[0].unionall(changed[1:])
+        width, height = self.surface.get_size()
+        pixels = np.frombuffer(self.surface.get_buffer(), dtype=np.uint8)
+        pixels = pixels.reshape(height, self.surface.get_pitch())
+        if region.size == (width, height) and self.surface.get_pitch() == 4 * width:
+            self.texture.write(pixels)
+        else:
+            rows = pixels[region.top : region.bottom, 4 * region.left : 4 * region.right]
+            self.texture.write(
+                np.ascontiguousarray(rows),
+                viewport=(region.left, region.top, region.width, region.height),
+            )
+        # the buffer keeps the surface locked for drawing
+        del pixels
+
+
+def _write_buffer(
+    ctx: "moderngl.Context", buffer: Optional[moderngl.Buffer], data: np.ndarray
+) -> Tuple[moderngl.Buffer, bool]:
+    """
+    :returns: `buffer` overwritten with `data`, or a new buffer if the size changed, and
+    whether it is a new one
+    """
+    data = np.ascontiguousarray(data)
+    if buffer is not None and buffer.size == data.nbytes:
+        buffer.write(data)
+        return buffer, False
+    if buffer is not None:
+        buffer.release()
+    return ctx.buffer(data), True
+
+
+class EdgeBatch:
+    """
+    Lines between points in screen coordinates, drawn on the GPU in a single call. Lines take
+    the shorter way around the world, the scroll is applied by the shader so nothing has to be
+    uploaded while scrolling. Where the lines are is uploaded once with `set_geometry`, how they
+    look with `set_style` whenever that changes.
+    """
+
+    def __init__(self, ctx: "moderngl.Context", program: "moderngl.Program"):
+        self.ctx = ctx
+        self.program = program
+        self.count = 0
+        self._geometry: Optional[moderngl.Buffer] = None
+        self._style: Optional[moderngl.Buffer] = None
+        self._vao: Optional[moderngl.VertexArray] = None
+
+    def set_geometry(self, begins: np.ndarray, ends: np.ndarray):
+        """
+        :param begins: An (m, 2) array of where every line begins
+        :param ends: An (m, 2) array of where every line ends
+        """
+        self.count = len(begins)
+        if not self.count:
+            return
+        # every vertex knows the other end of its line to decide on wrapping
+        vertices = np.empty((len(begins), 2, 4), dtype="f4")
+        vertices[:, 0, :2] = vertices[:, 1, 2:] = begins
+        vertices[:, 1, :2] = vertices[:, 0, 2:] = ends
+        self._geometry, created = _write_buffer(self.ctx, self._geometry, vertices)
+        if created:
+            self._release_vao()
+
+    def set_style(self, colors: np.ndarray, glow: np.ndarray):
+        """
+        :param colors: An (m, 4) array of the RGBA color of every line, 0 to 255
+        :param glow: An (m,) array, 1 for lines which pulse like the glow of the UI
+        """
+        if not len(colors):
+            return
+        style = np.empty((len(colors), 2, 5), dtype="f4")
+        style[:, :, :4] = (np.asarray(colors, dtype="f4") / 255)[:, None]
+        style[:, :, 4] = np.asarray(glow, dtype="f4")[:, None]
+        self._style, created = _write_buffer(self.ctx, self._style, style)
+        if created:
+            self._release_vao()
+
+    def _release_vao(self):
+        if self._vao is not None:
+            self._vao.release()
+            self._vao = None
+
+    def render(self):
+        if not self.count or self._geometry is None or self._style is None:
+            return
+        if self._vao is None:
+            self._vao = self.ctx.vertex_array(
+                self.program,
+                [
+                    (self._geometry, "2f 2f", "position", "other"),
+                    (self._style, "4f 1f", "color", "glow"),
+                ],
+            )
+        # the second instance draws the part of wrapping lines which left the screen
+        self._vao.render(moderngl.LINES, vertices=2 * self.count, instances=2)
+
+
+class MarkerBatch:
+    """
+    Filled circles at points in screen coordinates, drawn on the GPU as one instanced quad. The
+    scroll is applied by the shader like for `EdgeBatch`.
+    """
+
+    def __init__(
+        self,
+        ctx: "moderngl.Context",
+        program: "moderngl.Program",
+        corners: "moderngl.Buffer",
+    ):
+        self.ctx = ctx
+        self.program = program
+        self.corners = corners
+        self.count = 0
+        self._instances: Optional[moderngl.Buffer] = None
+        self._vao: Optional[moderngl.VertexArray] = None
+
+    def set_markers(
+        self,
+        centers: np.ndarray,
+        radii: np.ndarray,
+        colors: np.ndarray,
+        glow: np.ndarray,
+    ):
+        """
+        :param centers: An (m, 2) array of the centers
+        :param radii: An (m,) array of radii relative to the shorter side of the screen, like
+        the one of `Renderer.draw_circle`
+        :param colors: An (m, 4) array of RGBA colors, 0 to 255
+        :param glow: An (m,) array, 1 for markers which pulse like the glow of the UI
+        """
+        instances = np.empty((len(centers), 8), dtype="f4")
+        instances[:, :2] = centers
+        instances[:, 2] = radii
+        instances[:, 3:7] = np.asarray(colors, dtype="f4") / 255
+        instances[:, 7] = glow
+        self.count = len(centers)
+        if not self.count:
+            return
+        self._instances, created = _write_buffer(self.ctx, self._instances, instances)
+        if created and self._vao is not None:
+            self._vao.release()
+            self._vao = None
+
+    def render(self):
+        if not self.count:
+            return
+        if self._vao is None:
+            self._vao = self.ctx.vertex_array(
+                self.program,
+                [
+                    (self.corners, "2f", "corner"),
+                    (self._instances, "2f 1f 4f 1f/i", "center", "radius", "color", "glow"),
+                ],
+            )
+        self._vao.render(moderngl.TRIANGLE_STRIP, instances=self.count)
+
+
 def get_screen_size():
     screen_info = pygame.display.Info()
     return np.array(
@@ -35,12 +297,17 @@ class Renderer:
             screen_size = get_screen_size()
         #Initialize renderer by creating a screen and surfaces
         self.screen = pygame.display.set_mode(screen_size, PYGAME_MODE_FLAGS)
-        self.surface = pygame.Surface(screen_size, flags=pygame.SRCALPHA)
-        self.text_surface = pygame.Surface(screen_size, flags=pygame.SRCALPHA)
         self.fullscreen = False
+        # font sizes are relative to this, see `font_pixel_size`
+        self.display_size = get_screen_size()
+        self._fonts: dict[int, pygame.font.Font] = {}
+        self._texts: OrderedDict[tuple, pygame.Surface] = OrderedDict()
         self.ctx = moderngl.create_context()
         self.ctx.enable(moderngl.BLEND)
         self.ctx.blend_func = moderngl.SRC_ALPHA, moderngl.ONE_MINUS_SRC_ALPHA
+        # lines, circles and other UI elements, and the text on top of them
+        self.ui_layer = RenderLayer(self.ctx, screen_size)
+        self.text_layer = RenderLayer(self.ctx, screen_size)
 
         #Load day and night world maps as textures to use in the shaders and load all the shader files
         self.day_texture = load_texture(self.ctx, "day_map.png", screen_size)
@@ -51,6 +318,10 @@ class Renderer:
         self.ui_fragment_shader = load_shader("drakula/shaders/ui_fragment_shader.glsl")
         self.text_vertex_shader = load_shader("drakula/shaders/text_vertex_shader.glsl")
         self.text_fragment_shader = load_shader("drakula/shaders/text_fragment_shader.glsl")
+        self.edge_vertex_shader = load_shader("drakula/shaders/edge_vertex_shader.glsl")
+        self.edge_fragment_shader = load_shader("drakula/shaders/edge_fragment_shader.glsl")
+        self.marker_vertex_shader = load_shader("drakula/shaders/marker_vertex_shader.glsl")
+        self.marker_fragment_shader = load_shader("drakula/shaders/marker_fragment_shader.glsl")
         #Create shader programs for each surface (background, pygame drawing surface and text surface)
         self.program = self.ctx.program(
             vertex_shader=self.vertex_shader, fragment_shader=self.fragment_shader
@@ -61,6 +332,13 @@ class Renderer:
         self.text_program = self.ctx.program(
             vertex_shader=self.text_vertex_shader, fragment_shader=self.text_fragment_shader,
         )
+        #Programs for the batches of lines and circles drawn directly on the GPU
+        self.edge_program = self.ctx.program(
+            vertex_shader=self.edge_vertex_shader, fragment_shader=self.edge_fragment_shader
+        )
+        self.marker_program = self.ctx.program(
+            vertex_shader=self.marker_vertex_shader, fragment_shader=self.marker_fragment_shader
+        )
 
         #Define the screen quad
         self._screen_quad_vertices = np.array(
@@ -74,29 +352,76 @@ class Renderer:
         self.text_vao = self.ctx.simple_vertex_array(
             self.text_program, self.vbo, "position"
         )
+        #The quad around a marker, see `MarkerBatch`
+        self.marker_corners = self.ctx.buffer(self._screen_quad_vertices)
+        self._batches: list = []
+        self._layers: list[Tuple[RenderLayer, bool, bool]] = []
 
         #Initialize needed variables
-        self.clock = pygame.time.Clock()
-        self.clock.tick(144) #Set FPS
         self.start_time = pygame.time.get_ticks()
         self.last_time = self.start_time
         self.current_time = None
         self.time = 0
         self.delta_time = 0
+        # Advance the time by this much per frame instead of following the clock, for replays
+        self.fixed_delta_time: Optional[float] = None
         self.frame_count = 0
         self.horizontal_scroll = 0.0
         self._warned_unused_uniform_members = set()
 
+    @property
+    def surface(self) -> pygame.Surface:
+        return self.ui_layer.surface
+
+    @property
+    def text_surface(self) -> pygame.Surface:
+        return self.text_layer.surface
+
+    def create_edge_batch(self) -> EdgeBatch:
+        return EdgeBatch(self.ctx, self.edge_program)
+
+    def create_marker_batch(self) -> MarkerBatch:
+        return MarkerBatch(self.ctx, self.marker_program, self.marker_corners)
+
+    def draw_batch(self, batch: Union[EdgeBatch, MarkerBatch]):
+        """
+        Draw `batch` above the background and below the layers in this frame, batches are drawn
+        in the order they were submitted
+        """
+        self._batches.append(batch)
+
+    def create_layer(self) -> RenderLayer:
+        """
+        :returns: A layer of the size of the screen for a scene to retain, see `draw_layer`
+        """
+        return RenderLayer(self.ctx, tuple(self.size))
+
+    def draw_layer(self, layer: RenderLayer, text: bool = False, scrolled: bool = False):
+        """
+        Draw a retained `layer` above the batches and below the layers of the renderer in this
+        frame, layers are drawn in the order they were submitted
+
+        :param text: Draw it like the text layer, without the glow of the UI
+        :param scrolled: Shift it by the horizontal scroll like the world map, only for text
+        """
+        self._layers.append((layer, text, scrolled))
+
     def blit(self, source: pygame.Surface, at: Coordinate):
-        self.surface.blit(source, self.project(at))
+        self.ui_layer.blit(source, self.project(at))
 
     def begin(self):
-        self.surface.fill((0, 0, 0, 0))
-        self.text_surface.fill((0, 0, 0, 0))
+        self._batches.clear()
+        self._layers.clear()
+        self.ui_layer.clear()
+        self.text_layer.clear()
 
         self.current_time = pygame.time.get_ticks()
-        self.time = (self.current_time - self.start_time) / 1000.0
-        self.delta_time = (self.current_time - self.last_time) / 1000.0
+        if self.fixed_delta_time is None:
+            self.time = (self.current_time - self.start_time) / 1000.0
+            self.delta_time = (self.current_time - self.last_time) / 1000.0
+        else:
+            self.time = self.frame_count * self.fixed_delta_time
+            self.delta_time = self.fixed_delta_time
 
         now = datetime.now()
         year, month, day = now.year, now.month, now.day
@@ -120,15 +445,29 @@ class Renderer:
             return
         self.program[name].value = value
 
+    def set_batch_uniforms(self):
+        uniforms = {
+            "iResolution": (*map(float, self.size), 1.0),
+            "iTime": self.time,
+            "horizontalScroll": self.horizontal_scroll,
+        }
+        for program in (self.edge_program, self.marker_program):
+            for name, value in uniforms.items():
+                # the compiler drops uniforms a shader does not use
+                if name in program._members:
+                    program[name].value = value
+
     def draw_line(
         self, color: pygame.Color, begin: Coordinate, end: Coordinate, width: float = 0
     ):
-        pygame.draw.line(
-            self.surface,
-            color,
-            self.project(begin),
-            self.project(end),
-            int(max(width * self.minimal_scalar, 1)),
+        self.ui_layer.mark(
+            pygame.draw.line(
+                self.surface,
+                color,
+                self.project(begin),
+                self.project(end),
+                int(max(width * self.minimal_scalar, 1)),
+            )
         )
 
     def draw_line_wrapping(
@@ -149,13 +488,46 @@ class Renderer:
             self.draw_line(color, a, b, width)
 
     def draw_circle(self, color: pygame.Color, at: Coordinate, radius: float):
-        pygame.draw.circle(
-            self.surface, color, self.project(at), radius * self.minimal_scalar
+        self.ui_layer.mark(
+            pygame.draw.circle(
+                self.surface, color, self.project(at), radius * self.minimal_scalar
+            )
         )
 
-    def font(self, size) -> pygame.font:
-        size = size / get_screen_size()[0]
-        return pygame.font.Font(None, round(2 * size * self.minimal_scalar))
+    def font_pixel_size(self, size: float) -> int:
+        return round(2 * size / self.display_size[0] * self.minimal_scalar)
+
+    def font(self, size: float) -> pygame.font.Font:
+        """
+        :returns: The default font in `size`, loaded once per pixel size
+        """
+        pixel_size = self.font_pixel_size(size)
+        font = self._fonts.get(pixel_size)
+        if font is None:
+            font = self._fonts[pixel_size] = pygame.font.Font(None, pixel_size)
+        return font
+
+    def render_text(
+        self, text: str, size: float, color, antialias: bool = True
+    ) -> pygame.Surface:
+        """
+        :returns: `text` rendered in the font of `font(size)`, the most recently used texts are
+        cached. Must not be modified.
+        """
+        key = (text, self.font_pixel_size(size), tuple(color), antialias)
+        surface = self._texts.get(key)
+        if surface is not None:
+            self._texts.move_to_end(key)
+            return surface
+        surface = self.font(size).render(text, antialias, color)
+        self._texts[key] = surface
+        if len(self._texts) > TEXT_CACHE_SIZE:
+            self._texts.popitem(last=False)
+        return surface
+
+    def clear_text_cache(self):
+        self._fonts.clear()
+        self._texts.clear()
 
     def end(self):
         #Clear the OpenGL context to start a new frame
@@ -173,25 +545,35 @@ class Renderer:
         #Render the background with the world map and day/night cycle
         self.vao.render(moderngl.TRIANGLE_STRIP)
 
-        #Convert Pygame surface to texture and render it (Pygame drawn lines, circles and other UI elements)
-        surface_string = pygame.image.tobytes(self.surface, "RGBA")
-        pygame_texture = self.ctx.texture(self.surface.get_size(), 4, surface_string)
-        pygame_texture.use(0)
-        self.pygame_vao.render(moderngl.TRIANGLE_STRIP)
-        pygame_texture.release()
+        #Render the batches drawn on the GPU, scrolled by the shaders
+        if self._batches:
+            self.set_batch_uniforms()
+            for batch in self._batches:
+                batch.render()
 
-        #Convert text surface to texture and render it
-        text_string = pygame.image.tobytes(self.text_surface, "RGBA")
-        text_texture = self.ctx.texture(self.text_surface.get_size(), 4, text_string)
-        text_texture.use(0)
-        self.text_vao.render(moderngl.TRIANGLE_STRIP)
-        text_texture.release()
+        #Upload what changed on the Pygame surfaces and render them (retained layers of the scenes, lines, circles and other UI elements, then text)
+        for layer, text, scrolled in self._layers:
+            self.composite(layer, text, self.horizontal_scroll if scrolled else 0.0)
+        self.composite(self.ui_layer)
+        self.composite(self.text_layer, text=True)
 
         #Display the rendered frame with all layers
         pygame.display.flip()
+        if self.frame_count == 0:
+            startup_profile.mark("first frame")
         self.last_time = self.current_time
         self.frame_count += 1
 
+    def composite(self, layer: RenderLayer, text: bool = False, scroll: float = 0.0):
+        layer.upload()
+        layer.texture.use(0)
+        if text:
+            if "horizontalScroll" in self.text_program._members:
+                self.text_program["horizontalScroll"].value = scroll
+            self.text_vao.render(moderngl.TRIANGLE_STRIP)
+        else:
+            self.pygame_vao.render(moderngl.TRIANGLE_STRIP)
+
     def handle_event(self, event: pygame.event.Event) -> bool:
         """
         Handle all the events relevant to the renderer.
@@ -201,8 +583,10 @@ class Renderer:
         if event.type == pygame.VIDEORESIZE:
             screen_size = event.size
             self.screen = pygame.display.set_mode(screen_size, PYGAME_MODE_FLAGS)
-            self.surface = pygame.Surface(screen_size, flags=pygame.SRCALPHA)
-            self.text_surface = pygame.Surface(screen_size, flags=pygame.SRCALPHA)
+            self.ui_layer.resize(screen_size)
+            self.text_layer.resize(screen_size)
+            self.display_size = get_screen_size()
+            self.clear_text_cache()
             self.set_uniform("iResolution", [*screen_size, 1.0])
         return False
 
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import struct
+from time import perf_counter
+from typing import BinaryIO, NamedTuple, Optional
+
+import numpy as np
+import pygame
+
+from .logging import logger
+from .search import DRACULA_BRAINS, SEARCH_BUDGET_NODES
+from .state import GameState
+
+REPLAY_MAGIC = b"DRAKREPL"
+REPLAY_VERSION = 2
+# Magic, version, seed, the id of the world, see `world_id`, the index of the brain of
+# Dracula in `DRACULA_BRAINS` and the positions it searches per turn
+REPLAY_HEADER = struct.Struct(f"<{len(REPLAY_MAGIC)}sIqQBI")
+# One record per event, written as it happens so an exit mid-game keeps everything before it
+REPLAY_EVENT_DTYPE = np.dtype(
+    [
+        ("time_ms", "<u4"),
+        ("type", "<u4"),
+        ("key", "<i4"),
+        ("mod", "<u2"),
+        ("unicode", "<u4"),
+        ("width", "<u2"),
+        ("height", "<u2"),
+    ]
+)
+# Everything the scenes, the character and the renderer react to
+REPLAY_EVENT_TYPES = (pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP, pygame.VIDEORESIZE)
+# Simulated time per frame during replays
+REPLAY_DELTA_TIME = 1 / 60
+
+
+class ReplayConfig(NamedTuple):
+    record_path: Optional[str]
+    replay_path: Optional[str]
+    # Replay as fast as possible instead of in the pace of the recording
+    fast: bool
+
+
+def replay_config() -> ReplayConfig:
+    """
+    :returns: The paths in `DRAKULA_RECORD` and `DRAKULA_REPLAY`, replaying wins if both are set
+    """
+    replay_path = (os.getenv("DRAKULA_REPLAY") or "").strip() or None
+    record_path = (os.getenv("DRAKULA_RECORD") or "").strip() or None
+    fast = (os.getenv("DRAKULA_REPLAY_FAST") or "").strip().lower() in ("1", "true", "yes")
+    return ReplayConfig(None if replay_path else record_path, replay_path, fast)
+
+
+def world_id(state: GameState) -> int:
+    """
+    :returns: A 64-bit digest of the airports, their order and where they are, equal for
+    equally generated worlds
+    """
+    airports = state.airports
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(np.asarray(airports.id, dtype="<i8").tobytes())
+    digest.update(np.asarray(airports.latitude_deg, dtype="<f8").tobytes())
+    digest.update(np.asarray(airports.longitude_deg, dtype="<f8").tobytes())
+    return int.from_bytes(digest.digest(), "little")
+
+
+def fresh_seed() -> int:
+    return int(np.random.SeedSequence().entropy % 2**32)
+
+
+def encode_event(event: pygame.event.Event, time_ms: int) -> np.ndarray:
+    record = np.zeros(1, dtype=REPLAY_EVENT_DTYPE)
+    record["time_ms"] = time_ms
+    record["type"] = event.type
+    if event.type in (pygame.KEYDOWN, pygame.KEYUP):
+        record["key"] = event.key
+        record["mod"] = event.mod
+        unicode = getattr(event, "unicode", "")
+        record["unicode"] = ord(unicode) if len(unicode) == 1 else 0
+    elif event.type == pygame.VIDEORESIZE:
+        record["width"], record["height"] = event.size
+    return record
+
+
+def decode_event(record: np.void) -> pygame.event.Event:
+    kind = int(record["type"])
+    if kind in (pygame.KEYDOWN, pygame.KEYUP):
+        return pygame.event.Event(
+            kind,
+            key=int(record["key"]),
+            mod=int(record["mod"]),
+            unicode=chr(record["unicode"]) if record["unicode"] else "",
+        )
+    if kind == pygame.VIDEORESIZE:
+        size = (int(record["width"]), int(record["height"]))
+        return pygame.event.Event(kind, size=size, w=size[0], h=size[1])
+    return pygame.event.Event(kind)
+
+
+class InputRecorder:
+    """
+    Passes the events of pygame through and appends the ones which matter to a replay file.
+    Only games against a Dracula deciding on the spot are reproducible, one thinking in the
+    background or within a time budget depends on the speed of the machine. The brain is
+    stored along, replays use the same one.
+
+    :param seed: Seed the world and Dracula were created with
+    :param brain: The kind of brain of Dracula, one of `DRACULA_BRAINS`
+    :param max_nodes: Positions the brain searches per turn, see `create_brain`
+    """
+
+    def __init__(
+        self,
+        path: str,
+        seed: int,
+        state: GameState,
+        brain: str = "weighted",
+        max_nodes: int = SEARCH_BUDGET_NODES,
+    ):
+        self.path = path
+        self.seed = seed
+        self.start_ms = pygame.time.get_ticks()
+        self._file: BinaryIO = open(path, "wb")
+        self._file.write(
+            REPLAY_HEADER.pack(
+                REPLAY_MAGIC,
+                REPLAY_VERSION,
+                seed,
+                world_id(state),
+                DRACULA_BRAINS.index(brain),
+                max_nodes,
+            )
+        )
+        logger.info(f"Recording the input into {path}")
+
+    def events(self) -> list[pygame.event.Event]:
+        events = pygame.event.get()
+        time_ms = pygame.time.get_ticks() - self.start_ms
+        records = [
+            encode_event(event, time_ms)
+            for event in events
+            if event.type in REPLAY_EVENT_TYPES
+        ]
+        if records:
+            self._file.write(np.concatenate(records).tobytes())
+            self._file.flush()
+        return events
+
+    def close(self):
+        self._file.close()
+
+
+class InputReplayer:
+    """
+    Feeds the events of a recording back at a fixed `delta_time`. Events are handed out in the
+    first frame whose simulated time reached the time they were recorded at. Only a quit of the
+    window is taken from pygame meanwhile.
+
+    :param fast: Do not wait for the time of the recording to pass, for profiling
+    :raises ValueError: If the file is not a replay of a supported version
+    """
+
+    def __init__(self, path: str, fast: bool = False, delta_time: float = REPLAY_DELTA_TIME):
+        with open(path, "rb") as file:
+            data = file.read()
+        if len(data) < REPLAY_HEADER.size or not data.startswith(REPLAY_MAGIC):
+            raise ValueError(f"{path} is not a replay")
+        version = REPLAY_HEADER.unpack_from(data)[1]
+        if version != REPLAY_VERSION:
+            raise ValueError(f"Replay version {version} is not supported")
+        _, _, self.seed, self.world_id, brain, self.max_nodes = REPLAY_HEADER.unpack_from(data)
+        if brain >= len(DRACULA_BRAINS):
+            raise ValueError(f"{path} was recorded against an unknown Dracula")
+        self.brain = DRACULA_BRAINS[brain]
+        body = data[REPLAY_HEADER.size :]
+        # a recording cut off while writing ends with a partial record
+        usable = len(body) - len(body) % REPLAY_EVENT_DTYPE.itemsize
+        self.records = np.frombuffer(body[:usable], dtype=REPLAY_EVENT_DTYPE)
+
+        self.path = path
+        self.fast = fast
+        self.delta_time = delta_time
+        self.frame = 0
+        self._next = 0
+        self._begin = self._last_frame = 0.0
+        self.frame_times: list[float] = []
+        logger.info(f"Replaying {len(self.records)} events from {path}")
+
+    def check_world(self, state: GameState):
+        """
+        :raises ValueError: If `state` is not the world the replay was recorded on
+        """
+        if world_id(state) != self.world_id:
+            raise ValueError(f"{self.path} was recorded on another world")
+
+    @property
+    def finished(self) -> bool:
+        return self._next >= len(self.records)
+
+    def events(self) -> list[pygame.event.Event]:
+        now = perf_counter()
+        if self.frame == 0:
+            # the recording starts with the first frame, not with loading the world
+            self._begin = self._last_frame = now
+        # the time since the previous call, waiting for the recording is not part of a frame
+        self.frame_times.append(now - self._last_frame)
+
+        simulated_ms = 1000 * self.frame * self.delta_time
+        if not self.fast:
+            ahead = simulated_ms / 1000 - (now - self._begin)
+            if ahead > 0:
+                pygame.time.wait(int(1000 * ahead))
+        self.frame += 1
+        self._last_frame = perf_counter()
+
+        events = [event for event in pygame.event.get() if event.type == pygame.QUIT]
+        if self.finished:
+            return events + [pygame.event.Event(pygame.QUIT)]
+        end = np.searchsorted(self.records["time_ms"], simulated_ms, side="right")
+        events += [decode_event(record) for record in self.records[self._next : end]]
+        self._next = max(self._next, end)
+        if self.finished:
+            # reported now, the last event may well end the process
+            self.report()
+        return events
+
+    def report(self):
+        frame_times = np.array(self.frame_times[1:]) * 1000
+        if not len(frame_times):
+            return
+        logger.info(
+            f"Replayed {self.frame} frames in {perf_counter() - self._begin:.2f}s, frame "
+            f"times mean {frame_times.mean():.2f}ms, median {np.median(frame_times):.2f}ms, "
+            f"95th percentile {np.percentile(frame_times, 95):.2f}ms, "
+            f"max {frame_times.max():.2f}ms"
+        )
@@ -0,0 +1,198 @@
+import io
+import os
+import struct
+import zipfile
+from time import perf_counter
+from typing import Optional
+
+import numpy as np
+
+from .graph import AirportGraph
+from .logging import logger
+from .models import AirportTable
+from .snapshot import StringInterner
+from .state import AirportStatus, DynamicState, GameState, World
+
+SAVEGAME_MAGIC = b"DRAKSAVE"
+SAVEGAME_VERSION = 1
+# Magic followed by the version as a little-endian unsigned 32-bit integer
+SAVEGAME_HEADER = struct.Struct(f"<{len(SAVEGAME_MAGIC)}sI")
+
+SAVEGAME_NUMERIC_COLUMNS = ("id", "latitude_deg", "longitude_deg", "elevation_ft")
+SAVEGAME_STRING_PREFIX = "column_"
+# Airport data never contains NUL, so the string table is stored as one separated blob and
+# decoded in a single call
+SAVEGAME_STRING_SEPARATOR = "\0"
+
+
+def default_savegame_path() -> Optional[str]:
+    """
+    :returns: Where the running game is saved on quit, None if saving is disabled by an empty
+    `DRAKULA_SAVEGAME`
+    """
+    path = os.getenv("DRAKULA_SAVEGAME")
+    if path is None:
+        return "drakula.sav"
+    return path.strip() or None
+
+
+def save_game(state: GameState, path: str):
+    """
+    Write the airports, their connections and the current turn into `path`. The file is
+    replaced atomically, an interrupted save never corrupts the previous one.
+    """
+    airports, dynamic = state.airports, state.dynamic
+
+    arrays = {name: getattr(airports, name) for name in SAVEGAME_NUMERIC_COLUMNS}
+    interner = StringInterner()
+    for name, values in airports.strings.items():
+        arrays[SAVEGAME_STRING_PREFIX + name] = np.fromiter(
+            (interner.intern(value) for value in values), dtype=np.uint32, count=len(values)
+        )
+    blob = SAVEGAME_STRING_SEPARATOR.join(interner.indices).encode("utf-8")
+    arrays["string_table"] = np.frombuffer(blob, dtype=np.uint8)
+
+    arrays["graph_indptr"] = state.graph.indptr
+    arrays["graph_indices"] = state.graph.indices
+
+    arrays["status"] = dynamic.status
+    arrays["timer"] = dynamic.timer
+    arrays["destroyed_airports"] = np.array(sorted(dynamic.destroyed_airports), dtype=np.int64)
+    arrays["dracula_trail"] = np.array(dynamic.dracula_trail, dtype=np.int64)
+    arrays["scalars"] = np.array(
+        [dynamic.dracula_location, dynamic.player_location, dynamic.trap_count], dtype=np.int64
+    )
+
+    staging = path + ".tmp"
+    with open(staging, "wb") as file:
+        file.write(SAVEGAME_HEADER.pack(SAVEGAME_MAGIC, SAVEGAME_VERSION))
+        # uncompressed, loading is a plain copy of every array
+        np.savez(file, **arrays)
+    os.replace(staging, path)
+    logger.info(f"Saved the game into {path}")
+
+
+def load_game(path: str) -> GameState:
+    """
+    Restore a game written by `save_game`. Neither the database, the dispersion nor the
+    triangulation are touched.
+
+    :raises ValueError: If the file is not a savegame of a supported version or is damaged
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if len(data) < SAVEGAME_HEADER.size:
+        raise ValueError(f"{path} is too short to be a savegame")
+    magic, version = SAVEGAME_HEADER.unpack_from(data)
+    if magic != SAVEGAME_MAGIC:
+        raise ValueError(f"{path} is not a savegame")
+    if version != SAVEGAME_VERSION:
+        raise ValueError(f"Savegame version {version} is not supported")
+
+    try:
+        return _read_game(data[SAVEGAME_HEADER.size :], path)
+    except (
+        zipfile.BadZipFile,
+        EOFError,
+        KeyError,
+        IndexError,
+        TypeError,
+        UnicodeDecodeError,
+    ) as e:
+        # a truncated or otherwise damaged archive
+        raise ValueError(f"{path} is damaged: {e!r}") from e
+
+
+def _read_game(data: bytes, path: str) -> GameState:
+    with np.load(io.BytesIO(data)) as arrays:
+        # every distinct string is decoded once, the columns refer to them by index
+        decoded = arrays["string_table"].tobytes().decode("utf-8").split(SAVEGAME_STRING_SEPARATOR)
+        strings = {
+            name[len(SAVEGAME_STRING_PREFIX) :]: [decoded[i] for i in arrays[name].tolist()]
+            for name in arrays.files
+            if name.startswith(SAVEGAME_STRING_PREFIX)
+        }
+        airports = AirportTable(*(arrays[name] for name in SAVEGAME_NUMERIC_COLUMNS), strings)
+        graph = AirportGraph(arrays["graph_indptr"], arrays["graph_indices"])
+
+        dracula_location, player_location, trap_count = arrays["scalars"].tolist()
+        dynamic = DynamicState(len(airports), player_location, dracula_location)
+        dynamic.trap_count = trap_count
+        dynamic.status = arrays["status"].astype(np.uint8)
+        dynamic.timer = arrays["timer"].astype(np.uint8)
+        dynamic.trapped = set(np.flatnonzero(dynamic.status == AirportStatus.TRAPPED).tolist())
+        dynamic.destroyed_airports = set(arrays["destroyed_airports"].tolist())
+        dynamic.dracula_trail = arrays["dracula_trail"].tolist()
+
+    _check_consistency(airports, graph, dynamic, path)
+    return GameState(World(airports, graph), dynamic)
+
+
+def _check_consistency(
+    airports: AirportTable, graph: AirportGraph, dynamic: DynamicState, path: str
+):
+    """
+    :raises ValueError: If the arrays of a loaded game do not fit together
+    """
+    n = len(airports)
+    problems = []
+    if any(len(getattr(airports, name)) != n for name in SAVEGAME_NUMERIC_COLUMNS) or any(
+        len(values) != n for values in airports.strings.values()
+    ):
+        problems.append("the columns of the airports differ in length")
+    if "ident" not in airports.strings:
+        problems.append("the airports have no idents")
+    if (
+        len(graph) != n
+        or graph.indptr[0] != 0
+        or graph.indptr[-1] != len(graph.indices)
+        or np.any(np.diff(graph.indptr) < 0)
+    ):
+        problems.append("the connections do not match the airports")
+    elif len(graph.indices) and (graph.indices.min() < 0 or graph.indices.max() >= n):
+        problems.append("connections lead to unknown airports")
+    if len(dynamic.status) != n or len(dynamic.timer) != n:
+        problems.append("the statuses do not match the airports")
+    elif dynamic.status.max(initial=0) > max(AirportStatus):
+        problems.append("unknown statuses")
+    for name in ("dracula_location", "player_location"):
+        if not 0 <= getattr(dynamic, name) < n:
+            problems.append(f"{name} is out of range")
+    if any(not 0 <= i < n for i in [*dynamic.destroyed_airports, *dynamic.dracula_trail]):
+        problems.append("destroyed airports or the trail of Dracula are out of range")
+    if dynamic.trap_count < 0:
+        problems.append("a negative amount of traps")
+    if problems:
+        raise ValueError(f"{path} is inconsistent: {', '.join(problems)}")
+
+
+def benchmark_load(n: int = 10000, repeats: int = 10, path: str = "benchmark.sav") -> float:
+    """
+    Save a synthetic world of `n` airports and time loading it back
+
+    :returns: The mean load time in seconds
+    """
+    from .world import synthetic_world
+
+    save_game(synthetic_world(n), path)
+    try:
+        begin = perf_counter()
+        for _ in range(repeats):
+            load_game(path)
+        seconds = (perf_counter() - begin) / repeats
+    finally:
+        os.remove(path)
+
+    logger.info(f"Loading a savegame of {n} airports takes {1000 * seconds:.2f}ms")
+    return seconds
+
+
+if __name__ == "__main__":
+    import sys
+    from logging import basicConfig as init_basic_logging, INFO
+
+    init_basic_logging()
+    logger.setLevel(INFO)
+    for n in map(int, sys.argv[1:] or ["1000", "10000", "100000"]):
+        benchmark_load(n)
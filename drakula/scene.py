@@ -11,3 +11,11 @@ class Scene(ABC):
 
     def handle_event(self, _: pygame.event.Event) -> bool:
         return False
+
+    @property
+    def animating(self) -> bool:
+        """
+        :returns: True while the scene changes from frame to frame without any input, the slow
+        animations of the shaders aside
+        """
+        return False
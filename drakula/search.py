@@ -0,0 +1,273 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+from time import perf_counter
+from typing import Optional
+
+import numpy as np
+
+from .dracula import DraculaBrain
+from .engine import WORLD_DESTROYED_THRESHOLD_PERCENT
+from .logging import logger
+from .state import AirportStatus, GameState
+
+SEARCH_BUDGET_MS = 200
+# Positions searched per turn instead of a time budget when the game has to be reproducible,
+# about as many as `SEARCH_BUDGET_MS` allows for
+SEARCH_BUDGET_NODES = 10000
+SEARCH_MAX_DEPTH = 16
+# The transposition table is cleared once it holds this many positions
+SEARCH_TABLE_SIZE = 2**18
+
+SEARCH_WIN_VALUE = 10.0
+# Hop distances to the player beyond this are all equally safe
+SEARCH_SAFE_DISTANCE = 3
+SEARCH_DISTANCE_WEIGHT = 0.2
+SEARCH_TRAPPED_PENALTY = 1.0
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def position_key(state: GameState, dracula_to_move: bool) -> int:
+    """
+    :returns: A hash of everything the rest of the game depends on
+    """
+    dynamic = state.dynamic
+    return hash(
+        (
+            dracula_to_move,
+            dynamic.dracula_location,
+            dynamic.player_location,
+            dynamic.trap_count,
+            len(dynamic.destroyed_airports),
+            dynamic.status.tobytes(),
+            dynamic.timer.tobytes(),
+        )
+    )
+
+
+def dracula_won(state: GameState) -> bool:
+    destroyed_percent = round(100 * len(state.destroyed_airports) / len(state.airports))
+    return (
+        state.dracula_location == state.player_location
+        or destroyed_percent > WORLD_DESTROYED_THRESHOLD_PERCENT
+    )
+
+
+def evaluate(state: GameState) -> float:
+    """
+    :returns: How good a position which is not over yet is for Dracula
+    """
+    # 1 once the world is destroyed, so every airport counts regardless of the world size
+    destroyed = len(state.destroyed_airports) / len(state.airports)
+    destroyed *= 100 / WORLD_DESTROYED_THRESHOLD_PERCENT
+    hops = state.graph.hop_distance(state.dracula_location, state.player_location)
+    if hops < 0 or hops > SEARCH_SAFE_DISTANCE:
+        hops = SEARCH_SAFE_DISTANCE
+    value = destroyed + SEARCH_DISTANCE_WEIGHT * hops / SEARCH_SAFE_DISTANCE
+    if state.dracula_on_trap():
+        value -= SEARCH_TRAPPED_PENALTY
+    return value
+
+
+class ExpectimaxSearch:
+    """
+    Iteratively deepening expectimax. Dracula picks the best of his moves, the player is
+    assumed to pick uniformly among the airports available to him or to wait. Traps the player
+    might still set are not considered.
+
+    :param budget_seconds: Time after which the search stops, the deepest completed iteration
+    decides
+    :param max_nodes: Stop after searching this many positions instead, ignoring the time, so
+    the moves do not depend on the speed of the machine
+    """
+
+    def __init__(
+        self,
+        budget_seconds: float,
+        max_depth: int = SEARCH_MAX_DEPTH,
+        max_nodes: Optional[int] = None,
+    ):
+        self.budget_seconds = budget_seconds
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.table: dict[tuple[int, int], float] = {}
+        self.nodes = 0
+        self._deadline = 0.0
+
+    def best_move(self, state: GameState, rng: np.random.Generator) -> Optional[int]:
+        """
+        :param state: Position with Dracula to move, not modified
+        :returns: The airport Dracula should fly to, None if not even the shallowest search
+        finished in time
+        """
+        self._deadline = perf_counter() + self.budget_seconds
+        self.nodes = 0
+        if len(self.table) > SEARCH_TABLE_SIZE:
+            self.table.clear()
+
+        best, depth = None, 0
+        try:
+            for depth in range(1, self.max_depth + 1):
+                values = self._root_values(state, depth)
+                top = max(values.values())
+                best = int(rng.choice([move for move, value in values.items() if value == top]))
+                if abs(top) >= SEARCH_WIN_VALUE:
+                    # a forced result, looking deeper changes nothing
+                    break
+        except SearchTimeout:
+            depth -= 1
+        logger.debug(f"Dracula searched {self.nodes} positions {depth} turns deep")
+        return best
+
+    def _root_values(self, state: GameState, depth: int) -> dict[int, float]:
+        return {
+            int(move): self._after_dracula_move(state, int(move), depth)
+            for move in state.graph[state.dracula_location]
+        }
+
+    def _tick(self):
+        self.nodes += 1
+        if self.max_nodes is not None:
+            if self.nodes > self.max_nodes:
+                raise SearchTimeout()
+        # checking the clock is cheap compared to copying a position
+        elif perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+    def _after_dracula_move(self, state: GameState, move: int, depth: int) -> float:
+        self._tick()
+        child = state.clone()
+        child.destroy(child.dracula_location)
+        child.dracula_location = move
+        if dracula_won(child):
+            return SEARCH_WIN_VALUE
+        return self._player_to_move(child, depth - 1)
+
+    def _player_to_move(self, state: GameState, depth: int) -> float:
+        if depth == 0:
+            return evaluate(state)
+        key = (position_key(state, False), depth)
+        if key in self.table:
+            return self.table[key]
+
+        neighbours = state.graph[state.player_location]
+        moves = neighbours[
+            (state.status[neighbours] == AirportStatus.AVAILABLE)
+            | (neighbours == state.dracula_location)
+        ]
+        # waiting is always possible, the player stays where he is
+        options = [*moves.tolist(), state.player_location]
+        value = sum(self._after_player_move(state, move, depth) for move in options)
+        value /= len(options)
+
+        self.table[key] = value
+        return value
+
+    def _after_player_move(self, state: GameState, move: int, depth: int) -> float:
+        self._tick()
+        if move == state.dracula_location:
+            return -SEARCH_WIN_VALUE
+        child = state.clone()
+        child.player_location = move
+        child.tick_trap_timer()
+        if child.dracula_on_trap():
+            # Dracula sits the turn out
+            return self._player_to_move(child, depth - 1)
+        return self._dracula_to_move(child, depth)
+
+    def _dracula_to_move(self, state: GameState, depth: int) -> float:
+        key = (position_key(state, True), depth)
+        if key in self.table:
+            return self.table[key]
+        value = max(
+            self._after_dracula_move(state, int(move), depth)
+            for move in state.graph[state.dracula_location]
+        )
+        self.table[key] = value
+        return value
+
+
+class SearchBrain(DraculaBrain):
+    """
+    Looks ahead with `ExpectimaxSearch`, by default on a worker thread so rendering goes on
+    while Dracula thinks. Falls back to the weighted moves of `DraculaBrain` if the budget is
+    too small for even a single turn.
+
+    :param background: Think on a worker thread, see `GameEngine.poll`
+    :param max_nodes: See `ExpectimaxSearch`
+    """
+
+    def __init__(
+        self,
+        budget_ms: float = SEARCH_BUDGET_MS,
+        background: bool = True,
+        max_nodes: Optional[int] = None,
+    ):
+        super().__init__()
+        self.search = ExpectimaxSearch(budget_ms / 1000, max_nodes=max_nodes)
+        self.asynchronous = background
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="dracula")
+            if background
+            else None
+        )
+
+    def choose_move(
+        self, state: GameState, location: int, rng: np.random.Generator
+    ) -> int:
+        position = state.clone()
+        position.dracula_location = location
+        move = self.search.best_move(position, rng)
+        if move is None:
+            return super().choose_move(state, location, rng)
+        return move
+
+    def submit(self, state: GameState, location: int, rng: np.random.Generator) -> Future:
+        """
+        Start deciding on the move in the background
+
+        :returns: A future resolving to the airport Dracula flies to
+        """
+        # the worker only ever sees its own copy, the game may be rendered meanwhile
+        return self._executor.submit(self.choose_move, state.clone(), location, rng)
+
+
+DRACULA_BRAINS = ("weighted", "search")
+
+
+def brain_kind(kind: Optional[str] = None) -> str:
+    """
+    :param kind: One of `DRACULA_BRAINS`, `DRAKULA_AI` or `weighted` if None
+    :returns: The kind of brain `create_brain` creates for `kind`
+    """
+    kind = (kind or os.getenv("DRAKULA_AI") or "weighted").strip().lower()
+    if kind not in DRACULA_BRAINS:
+        logger.warning(f"Unknown Dracula AI `{kind}`, using the weighted one")
+        return "weighted"
+    return kind
+
+
+def create_brain(
+    kind: Optional[str] = None,
+    budget_ms: Optional[float] = None,
+    background: bool = True,
+    max_nodes: Optional[int] = None,
+) -> DraculaBrain:
+    """
+    :param kind: See `brain_kind`
+    :param budget_ms: Time the search may take per turn, `DRAKULA_AI_BUDGET_MS` or
+    `SEARCH_BUDGET_MS` if None
+    :param background: See `SearchBrain`
+    :param max_nodes: Positions the search may visit per turn instead of a time budget, for
+    reproducible games
+    """
+    if brain_kind(kind) == "search":
+        if max_nodes is not None:
+            logger.info(f"Dracula searches {max_nodes} positions per turn")
+            return SearchBrain(background=background, max_nodes=max_nodes)
+        budget_ms = budget_ms or float(os.getenv("DRAKULA_AI_BUDGET_MS") or SEARCH_BUDGET_MS)
+        logger.info(f"Dracula searches for {budget_ms}ms per turn")
+        return SearchBrain(budget_ms, background)
+    return DraculaBrain()
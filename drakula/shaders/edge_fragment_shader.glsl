@@ -0,0 +1,10 @@
+#version 330
+uniform float iTime;
+in vec4 edgeColor;
+in float edgeGlow;
+out vec4 fragColor;
+
+void main() {
+    float intensity = 0.3 + sin(iTime * 6.0) + 1.0;
+    fragColor = mix(edgeColor, max(edgeColor, vec4(edgeColor.rgb * intensity, edgeColor.a)), edgeGlow);
+}
@@ -0,0 +1,24 @@
+#version 330
+uniform float horizontalScroll;
+// This end of the edge and the other one, in screen coordinates before scrolling
+in vec2 position;
+in vec2 other;
+in vec4 color;
+in float glow;
+out vec4 edgeColor;
+out float edgeGlow;
+
+void main() {
+    vec2 a = vec2(fract(position.x + horizontalScroll), position.y);
+    float b = fract(other.x + horizontalScroll);
+    // Edges take the shorter way around the globe, the right end moves left of the screen
+    if (a.x - b > 0.5) {
+        a.x -= 1.0;
+    }
+    // The second instance draws what went left of the screen on its right
+    a.x += float(gl_InstanceID);
+
+    gl_Position = vec4(a.x * 2.0 - 1.0, 1.0 - a.y * 2.0, 0.0, 1.0);
+    edgeColor = color;
+    edgeGlow = glow;
+}
@@ -0,0 +1,14 @@
+#version 330
+uniform float iTime;
+in vec2 markerCorner;
+in vec4 markerColor;
+in float markerGlow;
+out vec4 fragColor;
+
+void main() {
+    if (dot(markerCorner, markerCorner) > 1.0) {
+        discard;
+    }
+    float intensity = 0.3 + sin(iTime * 6.0) + 1.0;
+    fragColor = mix(markerColor, max(markerColor, vec4(markerColor.rgb * intensity, markerColor.a)), markerGlow);
+}
@@ -0,0 +1,24 @@
+#version 330
+uniform vec3 iResolution;
+uniform float horizontalScroll;
+// Corner of the quad around the marker, per vertex
+in vec2 corner;
+// Per instance, the radius is relative to the shorter side of the screen
+in vec2 center;
+in float radius;
+in vec4 color;
+in float glow;
+out vec2 markerCorner;
+out vec4 markerColor;
+out float markerGlow;
+
+void main() {
+    vec2 c = vec2(fract(center.x + horizontalScroll), center.y);
+    float radiusPx = radius * min(iResolution.x, iResolution.y);
+    vec2 offset = corner * radiusPx * 2.0 / iResolution.xy;
+
+    gl_Position = vec4(c.x * 2.0 - 1.0 + offset.x, 1.0 - c.y * 2.0 - offset.y, 0.0, 1.0);
+    markerCorner = corner;
+    markerColor = color;
+    markerGlow = glow;
+}
@@ -1,8 +1,12 @@
 #version 330
 uniform sampler2D text_texture;
+uniform float horizontalScroll;
 in vec2 uvs;
 out vec4 fragColor;
 
 void main() {
-    fragColor = texture(text_texture, uvs);
+    // Scrolled by whole pixels, so the text stays sharp
+    float width = float(textureSize(text_texture, 0).x);
+    float scroll = floor(horizontalScroll * width + 0.5) / width;
+    fragColor = texture(text_texture, vec2(fract(uvs.x - scroll), uvs.y));
 }
\ No newline at end of file
@@ -0,0 +1,220 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+from time import perf_counter
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+from .engine import GameEngine, GameOverKind, PlayerAction
+from .logging import logger
+from .search import DRACULA_BRAINS, create_brain
+from .state import AirportStatus
+from .world import AIRPORTS_PER_CONTINENT, synthetic_world
+
+# As many airports as a game fetched from the database, one sample per continent
+SIMULATION_AIRPORTS = 7 * AIRPORTS_PER_CONTINENT
+# Games still running after this many turns are counted as undecided
+SIMULATION_MAX_TURNS = 500
+SIMULATION_HISTOGRAM_BIN_TURNS = 5
+SIMULATION_WAIT_PROBABILITY = 0.1
+
+Policy = Callable[[GameEngine, np.random.Generator], PlayerAction]
+
+
+def random_policy(engine: GameEngine, rng: np.random.Generator) -> PlayerAction:
+    """
+    Flies to a random available airport, sometimes waits
+    """
+    moves = engine.legal_moves()
+    if not len(moves) or rng.random() < SIMULATION_WAIT_PROBABILITY:
+        return PlayerAction.wait()
+    return PlayerAction.move(rng.choice(moves))
+
+
+def trapper_policy(engine: GameEngine, rng: np.random.Generator) -> PlayerAction:
+    """
+    Traps every airport it visits while it has traps left, moves randomly otherwise
+    """
+    state = engine.state
+    if state.trap_count and state.status[state.player_location] == AirportStatus.AVAILABLE:
+        return PlayerAction.trap()
+    return random_policy(engine, rng)
+
+
+def chase_policy(engine: GameEngine, rng: np.random.Generator) -> PlayerAction:
+    """
+    Knows where Dracula is and flies the shortest route towards him, an upper bound for
+    any honest player
+    """
+    state = engine.state
+    moves = engine.legal_moves()
+    if not len(moves):
+        return PlayerAction.wait()
+    hops = state.graph.hop_distances(state.dracula_location)[moves].astype(np.int64)
+    hops[hops < 0] = len(state.airports)
+    closest = moves[hops == hops.min()]
+    return PlayerAction.move(rng.choice(closest))
+
+
+POLICIES: dict[str, Policy] = {
+    "random": random_policy,
+    "trapper": trapper_policy,
+    "chase": chase_policy,
+}
+
+
+class GameRecord(NamedTuple):
+    seed: int
+    # None if the game was still running after the turn limit
+    outcome: Optional[GameOverKind]
+    turns: int
+
+
+def play_game(
+    seed: int,
+    policy: str = "random",
+    airports: int = SIMULATION_AIRPORTS,
+    max_turns: int = SIMULATION_MAX_TURNS,
+    brain: str = "weighted",
+    budget_ms: Optional[float] = None,
+) -> GameRecord:
+    """
+    Play a whole game on a synthetic world without a window. Equal arguments play equal games,
+    unless Dracula searches with a time budget.
+
+    :param seed: Seed of the world, Dracula and the player
+    :param policy: Name of the policy playing, see `POLICIES`
+    :param brain: Brain of Dracula, see `create_brain`
+    """
+    rng = np.random.default_rng(seed)
+    engine = GameEngine(
+        synthetic_world(airports, seed),
+        create_brain(brain, budget_ms, background=False),
+        seed=seed,
+    )
+    act = POLICIES[policy]
+    while engine.outcome is None and engine.turn < max_turns:
+        if not engine.step(act(engine, rng)).accepted:
+            engine.step(PlayerAction.wait())
+    return GameRecord(seed, engine.outcome, engine.turn)
+
+
+class SimulationReport:
+    def __init__(self, policy: str, records: list[GameRecord], seconds: float):
+        self.policy = policy
+        self.records = records
+        self.seconds = seconds
+
+    @property
+    def games(self) -> int:
+        return len(self.records)
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / max(self.seconds, 1e-9)
+
+    def outcome_counts(self) -> Counter:
+        """
+        :returns: The amount of games per outcome, None counts the undecided ones
+        """
+        return Counter(record.outcome for record in self.records)
+
+    def ratio(self, outcome: Optional[GameOverKind]) -> float:
+        return self.outcome_counts()[outcome] / max(self.games, 1)
+
+    def turn_histogram(
+        self, bin_turns: int = SIMULATION_HISTOGRAM_BIN_TURNS
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :returns: The amount of games per bin of game lengths and the edges of the bins
+        """
+        turns = np.array([record.turns for record in self.records])
+        edges = np.arange(0, turns.max(initial=0) + bin_turns + 1, bin_turns)
+        return np.histogram(turns, edges)
+
+    def log(self):
+        logger.info(
+            f"Played {self.games} games with the {self.policy} policy in {self.seconds:.2f}s "
+            f"({self.games_per_second:.1f} games/s)"
+        )
+        for outcome in (*GameOverKind, None):
+            name = outcome.name if outcome is not None else "UNDECIDED"
+            logger.info(f"{name:>15}: {100 * self.ratio(outcome):5.1f}%")
+
+        counts, edges = self.turn_histogram()
+        scale = 50 / max(counts.max(initial=0), 1)
+        for count, begin, end in zip(counts, edges, edges[1:]):
+            logger.info(f"{begin:>4}-{end - 1:<4} turns {count:>6} {'#' * round(count * scale)}")
+
+
+def run_simulation(
+    games: int,
+    policy: str = "random",
+    airports: int = SIMULATION_AIRPORTS,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    max_turns: int = SIMULATION_MAX_TURNS,
+    brain: str = "weighted",
+    budget_ms: Optional[float] = None,
+) -> SimulationReport:
+    """
+    Play `games` seeded games across a pool of processes
+
+    :param seed: Seed of the first game, the following ones count up from it
+    :param workers: Amount of processes, all cores if None and no pool at all if 1
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy `{policy}`, expected one of {', '.join(POLICIES)}")
+    seeds = range(seed, seed + games)
+    play = partial(
+        play_game,
+        policy=policy,
+        airports=airports,
+        max_turns=max_turns,
+        brain=brain,
+        budget_ms=budget_ms,
+    )
+
+    begin = perf_counter()
+    if workers == 1:
+        records = list(map(play, seeds))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # a few chunks per worker keep them all busy without shipping every game alone
+            chunksize = max(1, games // (4 * workers))
+            records = list(executor.map(play, seeds, chunksize=chunksize))
+    return SimulationReport(policy, records, perf_counter() - begin)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from logging import basicConfig as init_basic_logging, INFO
+
+    parser = ArgumentParser(description="Play many games of Drakula without a window")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--policy", choices=list(POLICIES), default="random")
+    parser.add_argument("--airports", type=int, default=SIMULATION_AIRPORTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-turns", type=int, default=SIMULATION_MAX_TURNS)
+    parser.add_argument("--brain", choices=DRACULA_BRAINS, default="weighted")
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    init_basic_logging()
+    report = run_simulation(
+        args.games,
+        args.policy,
+        args.airports,
+        args.seed,
+        args.workers,
+        args.max_turns,
+        args.brain,
+        args.budget_ms,
+    )
+    # raised only now, the engine logs every turn and only the report is interesting here
+    logger.setLevel(INFO)
+    report.log()
@@ -0,0 +1,320 @@
+import json
+from array import array
+import os
+import shutil
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .db import (
+    Database,
+    create_database,
+    sample_airport_ids,
+    table_fingerprint,
+    table_version,
+    version_matches,
+)
+from .logging import logger
+from .models import Airport
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_META_FILE = "meta.json"
+SNAPSHOT_STRINGS_FILE = "strings.bin"
+SNAPSHOT_STRING_OFFSETS_COLUMN = "string_offsets"
+
+# Typecodes shared by `array.array` and numpy, the sizes are the same on every platform
+AIRPORT_NUMERIC_COLUMNS = {
+    "id": "q",
+    "latitude_deg": "d",
+    "longitude_deg": "d",
+    "elevation_ft": "i",
+}
+AIRPORT_STRING_COLUMNS = [
+    name for name in Airport.model_fields if name not in AIRPORT_NUMERIC_COLUMNS
+]
+
+
+def default_snapshot_directory() -> str:
+    return os.getenv("DRAKULA_SNAPSHOT_DIR") or os.path.join(".drakula_cache", "airports")
+
+
+def is_offline() -> bool:
+    return (os.getenv("DRAKULA_OFFLINE") or "").strip().lower() in ("1", "true", "yes")
+
+
+def is_refresh_requested() -> bool:
+    return (os.getenv("DRAKULA_SNAPSHOT_REFRESH") or "").strip().lower() in ("1", "true", "yes")
+
+
+class StringInterner:
+    """
+    Stores every distinct string once, strings are referred to by their index in the table
+    """
+
+    def __init__(self):
+        self.indices: dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        return self.indices.setdefault(value, len(self.indices))
+
+    def encode(self) -> tuple[bytes, np.ndarray]:
+        """
+        :returns: The UTF-8 encoded table and the offsets of every string in it (one more than
+        the amount of strings)
+        """
+        encoded = [value.encode("utf-8") for value in self.indices]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(value) for value in encoded])
+        return b"".join(encoded), offsets
+
+
+class StringTable:
+    """
+    Read-only view of an interned string table, decodes the strings on access
+    """
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __getitem__(self, index: int) -> str:
+        begin, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.blob[begin:end]).decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class AirportSnapshot:
+    """
+    Columnar copy of the `airport` table. Every column lives in its own `.npy` file and is
+    memory-mapped on load, so only the rows which are actually read are paged in.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, SNAPSHOT_META_FILE), "r") as file:
+            meta = json.load(file)
+        if meta["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {meta['version']} is not supported")
+        self.directory = directory
+        self.fingerprint = (meta["row_count"], meta["checksum"])
+        self.table_version = (meta["created"], meta["updated"])
+
+        def column(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        self.numeric = {name: column(name) for name in AIRPORT_NUMERIC_COLUMNS}
+        self.strings = {name: column(name) for name in AIRPORT_STRING_COLUMNS}
+        strings_path = os.path.join(directory, SNAPSHOT_STRINGS_FILE)
+        self.string_table = StringTable(
+            # mapping an empty file is an error
+            np.memmap(strings_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(strings_path)
+            else b"",
+            column(SNAPSHOT_STRING_OFFSETS_COLUMN),
+        )
+
+    def __len__(self) -> int:
+        return len(self.numeric["id"])
+
+    def matches(self, version: tuple[Optional[str], Optional[str]]) -> bool:
+        """
+        :param version: The current `table_version` of the `airport` table
+        :returns: False if the table changed since the snapshot was exported
+        """
+        return version_matches(self.table_version, version)
+
+    def airport(self, row: int) -> Airport:
+        """
+        :param row: Row of the snapshot, not the id of the airport
+        :returns: The airport stored in that row
+        """
+        fields = {name: values[row].item() for name, values in self.numeric.items()}
+        for name, indices in self.strings.items():
+            fields[name] = self.string_table[indices[row]]
+        # The rows were validated when the snapshot was exported
+        return Airport.model_construct(**fields)
+
+    def rows_of(self, ids: Iterable[int]) -> np.ndarray:
+        """
+        :param ids: Primary keys of the airports
+        :returns: Rows of the snapshot holding these airports
+        """
+        ids = np.asarray(list(ids), dtype=np.int64)
+        rows = np.searchsorted(self.numeric["id"], ids)
+        if np.any(rows >= len(self)) or np.any(self.numeric["id"][rows] != ids):
+            raise KeyError("Some of the requested airports are not in the snapshot")
+        return rows
+
+    def ids_by_continent(self) -> dict[str, np.ndarray]:
+        continents = self.strings["continent"]
+        return {
+            self.string_table[index]: np.asarray(self.numeric["id"][continents == index])
+            for index in np.unique(continents)
+        }
+
+
+def export_snapshot(
+    db: Database,
+    directory: str,
+    fingerprint: Optional[tuple[int, int]] = None,
+    version: Optional[tuple[Optional[str], Optional[str]]] = None,
+):
+    """
+    Dump the whole `airport` table into `directory`, replacing any previous snapshot.
+
+    :param db: The database to read the airports from
+    :param directory: Where to store the snapshot
+    :param fingerprint: Row count and checksum of the table, queried if None
+    :param version: `table_version` of the table, queried if None
+    """
+    # read before the rows, so a write during the export leaves the snapshot stale
+    created, updated = version or table_version(db)
+    row_count, checksum = fingerprint or table_fingerprint(db)
+
+    # Rows are streamed straight into compact column buffers, so the table is never held as
+    # a list of rows or models
+    columns = [*AIRPORT_NUMERIC_COLUMNS, *AIRPORT_STRING_COLUMNS]
+    numeric = {name: array(code) for name, code in AIRPORT_NUMERIC_COLUMNS.items()}
+    strings = {name: array("I") for name in AIRPORT_STRING_COLUMNS}
+    interner = StringInterner()
+
+    def append_row(*row):
+        for name, value in zip(AIRPORT_NUMERIC_COLUMNS, row):
+            numeric[name].append(value or 0)
+        for name, value in zip(AIRPORT_STRING_COLUMNS, row[len(AIRPORT_NUMERIC_COLUMNS) :]):
+            strings[name].append(interner.intern(value or ""))
+
+    for _ in db.multi_query(
+        "select {columns} from airport order by id",
+        append_row,
+        columns=columns,
+        positional=True,
+        stream=True,
+    ):
+        pass
+
+    staging = directory + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    for name, code in AIRPORT_NUMERIC_COLUMNS.items():
+        np.save(os.path.join(staging, f"{name}.npy"), np.frombuffer(numeric[name], dtype=code))
+
+    blob, offsets = interner.encode()
+    with open(os.path.join(staging, SNAPSHOT_STRINGS_FILE), "wb") as file:
+        file.write(blob)
+    np.save(os.path.join(staging, f"{SNAPSHOT_STRING_OFFSETS_COLUMN}.npy"), offsets)
+    for name, values in strings.items():
+        np.save(os.path.join(staging, f"{name}.npy"), np.frombuffer(values, dtype=np.uint32))
+
+    # Written last, a snapshot without metadata is never loaded
+    with open(os.path.join(staging, SNAPSHOT_META_FILE), "w") as file:
+        json.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "row_count": row_count,
+                "checksum": checksum,
+                "created": created,
+                "updated": updated,
+            },
+            file,
+        )
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    logger.info(f"Exported {len(numeric['id'])} airports into {directory}")
+
+
+def load_snapshot(directory: str) -> Optional[AirportSnapshot]:
+    """
+    :returns: The snapshot stored in `directory` or None if there is no usable snapshot
+    """
+    try:
+        return AirportSnapshot(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug(f"No usable airport snapshot in {directory}: {e}")
+        return None
+
+
+class SnapshotDatabaseFacade:
+    """
+    Serves the same queries as `GameDatabaseFacade`, but from an `AirportSnapshot`
+    """
+
+    def __init__(self, snapshot: AirportSnapshot, db: Optional[Database] = None):
+        self.db = db
+        self.snapshot = snapshot
+        self._airport_ids = snapshot.ids_by_continent()
+        self._continents = sorted(self._airport_ids)
+
+    def fetch_airports_by_id(self, ids: Iterable[int]) -> list[Airport]:
+        return [self.snapshot.airport(row) for row in self.snapshot.rows_of(ids)]
+
+    def fetch_random_airports(
+        self,
+        amount: int = 1,
+        continent: Optional[str] = None,
+        *,
+        seed: Optional[int] = None,
+    ) -> list[Airport]:
+        continent = continent or "EU"
+        if continent and continent not in self._continents:
+            raise Exception(f"Continent `{continent}` does not exist")
+        ids = sample_airport_ids(self._airport_ids, amount, [continent], seed)
+        return self.fetch_airports_by_id(ids)
+
+    def fetch_random_airports_per_continent(
+        self,
+        amount: int = 1,
+        *,
+        seed: Optional[int] = None,
+    ) -> list[Airport]:
+        ids = sample_airport_ids(self._airport_ids, amount, self._continents, seed)
+        return self.fetch_airports_by_id(ids)
+
+
+def create_snapshot_facade(
+    directory: Optional[str] = None, refresh: Optional[bool] = None
+) -> SnapshotDatabaseFacade:
+    """
+    Serve airports from the on-disk snapshot, refreshing it first if the database is reachable
+    and its `airport` table changed. Without a database a present snapshot is used as is.
+    Changes are told apart by the `table_version`, the rows are only checksummed on request.
+
+    :param directory: Where the snapshot is stored, see `default_snapshot_directory`
+    :param refresh: Also compare the checksum of the whole table, `DRAKULA_SNAPSHOT_REFRESH`
+    if None
+    :returns: A facade backed by the snapshot
+    """
+    from mysql.connector import Error as DatabaseError
+
+    directory = directory or default_snapshot_directory()
+    refresh = is_refresh_requested() if refresh is None else refresh
+    snapshot = load_snapshot(directory)
+
+    if is_offline():
+        if snapshot is None:
+            raise Exception(f"Running offline, but there is no airport snapshot in {directory}")
+        return SnapshotDatabaseFacade(snapshot)
+
+    try:
+        db = create_database()
+        version = table_version(db)
+        fingerprint = table_fingerprint(db) if refresh else None
+    except DatabaseError as e:
+        if snapshot is None:
+            raise
+        logger.warning(f"Database unavailable ({e}), using the airport snapshot as is")
+        return SnapshotDatabaseFacade(snapshot)
+
+    if (
+        snapshot is None
+        or not snapshot.matches(version)
+        or (fingerprint is not None and snapshot.fingerprint != fingerprint)
+    ):
+        logger.info("Airport snapshot is missing or stale, exporting...")
+        export_snapshot(db, directory, fingerprint, version)
+        snapshot = AirportSnapshot(directory)
+
+    return SnapshotDatabaseFacade(snapshot, db)
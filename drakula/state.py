@@ -1,148 +1,319 @@
-import datetime
-from collections import defaultdict
-from enum import Enum
+from enum import IntEnum
+from logging import INFO
+from typing import Optional
+
 import numpy as np
-from geopy.distance import distance
 
-from .maths import geodesic_to_3d_pos, delaunay_triangulate_points, x_y_to_geo_pos_deg
-from .models import Airport
-from .utils import pairs
+from .completion import PrefixTrie
+from .graph import AirportGraph
+from .models import AirportTable
+from .triangulation import graph_from_airports
 from .logging import logger
 
 
-class AirportStatus(Enum):
+# A trap is released once it was ticked more times than this
+TRAP_TIMEOUT_TURNS = 3
+INITIAL_TRAP_COUNT = 3
+# Dracula starts at least this many flights away from the player
+MIN_DEGREE_OF_SEPARATION = 3
+# The status changes of a game are trimmed to the most recent ones once there are twice as many
+STATUS_CHANGES_KEPT = 1024
+
+
+class AirportStatus(IntEnum):
     AVAILABLE = 1
     DESTROYED = 2
     TRAPPED = 3
 
 
-class AirportState:
-    def __init__(self, airport, status):
-        self.airport = airport
-        self.status = status
-        self.timer = 0
+class World:
+    """
+    The part of a game which never changes once it started: the airports, their connections
+    and lookups derived from them. Shared by every copy of a `GameState`.
+    """
+
+    def __init__(self, airports: AirportTable, graph: Optional[AirportGraph] = None):
+        # copy the values to prevent accidental mutations
+        self.airports = airports.copy()
+        self.graph = graph if graph is not None else graph_from_airports(self.airports)
+        self.ident_index = {ident: i for i, ident in enumerate(self.airports.strings["ident"])}
+        self._neighbour_tries: dict[int, PrefixTrie[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.airports)
 
+    def get_index(self, icao):
+        return self.ident_index.get(icao, -1)
 
-def disperse_airports_inplace(airports: list[Airport], dt=0.1):
-    graph = graph_from_airports(airports)
+    def neighbour_trie(self, index: int) -> PrefixTrie[int]:
+        """
+        :returns: The idents of the airports connected to `index`, mapped to their indices
+        """
+        if index not in self._neighbour_tries:
+            idents = self.airports.strings["ident"]
+            self._neighbour_tries[index] = PrefixTrie(
+                (idents[i], int(i)) for i in self.graph[index]
+            )
+        return self._neighbour_tries[index]
 
-    def q(idx):
-        return np.log2(len(graph[idx]))
 
-    k = 0.04
-    for i, a in enumerate(airports):
-        q1 = q(i)
-        for j, b in enumerate(airports):
-            if i == j:
-                continue
+class DynamicState:
+    """
+    Everything a turn may change. Small enough to be copied thousands of times per second,
+    the arrays hold one byte per airport.
+    """
 
-            q2 = q(j)
+    __slots__ = (
+        "dracula_location",
+        "player_location",
+        "trap_count",
+        "status",
+        "timer",
+        "trapped",
+        "destroyed_airports",
+        "dracula_trail",
+    )
 
-            r = distance(a.geo_position, b.geo_position).miles
-            assert r != 0
+    def __init__(self, n: int, player_location: int, dracula_location: int):
+        self.dracula_location = dracula_location
+        self.player_location = player_location
+        self.trap_count = INITIAL_TRAP_COUNT
+        # `trapped` and `destroyed_airports` index into these
+        self.status = np.full(n, AirportStatus.AVAILABLE, dtype=np.uint8)
+        self.timer = np.zeros(n, dtype=np.uint8)
+        self.trapped: set[int] = set()
+        self.destroyed_airports: set[int] = {dracula_location}
+        self.dracula_trail: list[int] = [dracula_location]
 
-            f = k * q1 * q2 / r ** 2
-            magnitude = (f / q1) * (dt ** 2 / 2)
-            if np.isclose(magnitude, 0):
-                continue
+    def copy(self) -> "DynamicState":
+        copy = DynamicState.__new__(DynamicState)
+        copy.dracula_location = self.dracula_location
+        copy.player_location = self.player_location
+        copy.trap_count = self.trap_count
+        copy.status = self.status.copy()
+        copy.timer = self.timer.copy()
+        copy.trapped = self.trapped.copy()
+        copy.destroyed_airports = self.destroyed_airports.copy()
+        copy.dracula_trail = self.dracula_trail.copy()
+        return copy
 
-            displacement = (
-                    magnitude
-                    * (v := a.screen_position - b.screen_position)
-                    / np.linalg.norm(v)
-            )
-            lat, lon = x_y_to_geo_pos_deg(*displacement)
 
-            # naive force, wouldn't work like that
-            a.latitude_deg += lat
-            a.longitude_deg += lon
+class GameState:
+    """
+    A game in progress, a shared `World` and the `DynamicState` of the current turn.
+    `snapshot`, `restore` and `clone` only ever copy the dynamic part.
+    """
 
+    def __init__(self, world: World, dynamic: DynamicState):
+        self.world = world
+        self.dynamic = dynamic
+        self.undo_stack: list[DynamicState] = []
+        # Airports whose status changed, in order. Consumers remember the `change_count` they
+        # read up to and start over whenever the epoch changes, since the whole dynamic state
+        # was replaced. See `changes_since`.
+        self.status_changes: list[int] = []
+        # `change_count` before the oldest change which was kept
+        self.changes_base = 0
+        self.epoch = 0
 
-def graph_from_airports(airports):
-    points = []
-    for airport in airports:
-        point = geodesic_to_3d_pos(*airport.geo_position, airport.elevation_ft)
-        points.append(point)
-    points = np.array(points)
+    @classmethod
+    def new_game(
+        cls,
+        airports: AirportTable,
+        player_start_location: int,
+        rng: Optional[np.random.Generator] = None,
+    ) -> "GameState":
+        """
+        :param rng: The generator to place Dracula with
+        :returns: A fresh game with Dracula placed far enough from the player
+        """
+        world = World(airports)
+        hops = world.graph.hop_distances(player_start_location)
+        vertices = np.flatnonzero((hops < 0) | (hops >= MIN_DEGREE_OF_SEPARATION))
+        assert len(vertices) != 0
+        dracula_location = int((rng or np.random.default_rng()).choice(vertices))
+        return cls(world, DynamicState(len(world), int(player_start_location), dracula_location))
 
-    hull = delaunay_triangulate_points(points)
+    @property
+    def airports(self) -> AirportTable:
+        return self.world.airports
 
-    graph = defaultdict(set)
-    for simplex in hull:
-        for i, j in pairs(simplex):
-            graph[i].add(j)
-            graph[j].add(i)
+    @property
+    def graph(self) -> AirportGraph:
+        return self.world.graph
 
-    ret_graph: dict[int, list[int]] = {}
-    for vert in graph:
-        ret_graph[vert] = list(graph[vert])
+    @property
+    def status(self) -> np.ndarray:
+        return self.dynamic.status
 
-    return ret_graph
+    @property
+    def timer(self) -> np.ndarray:
+        return self.dynamic.timer
 
+    @property
+    def trapped(self) -> set[int]:
+        return self.dynamic.trapped
 
-class GameState:
-    def __init__(
-        self,
-        airports: list[Airport],
-        player_start_location: int,
-    ):
-        # copy the values to prevent accidental mutations
-        self.states = [
-            AirportState(airport, AirportStatus.AVAILABLE) for airport in airports
-        ]
-        self.airports = airports.copy()
+    @property
+    def destroyed_airports(self) -> set[int]:
+        return self.dynamic.destroyed_airports
 
-        self.graph = graph_from_airports(self.airports)
-
-        # TODO: refactor me
-        min_degree_of_separation = 3
-        banned_vertices = [player_start_location]
-        for i in range(min_degree_of_separation - 1):
-            new_banned = []
-            for v in banned_vertices:
-                for neighbour in self.graph[v]:
-                    new_banned.append(neighbour)
-            banned_vertices.extend(new_banned)
-
-        vertices = set(range(len(self.airports)))
-        for v in banned_vertices:
-            if v in vertices:
-                vertices.remove(v)
-        assert len(vertices) != 0
-        self.dracula_location = np.random.choice(list(vertices), 1)[0]
-        self.dracula_trail = [self.dracula_location]
-        self.destroyed_airports = set(self.dracula_trail)
+    @property
+    def dracula_trail(self) -> list[int]:
+        return self.dynamic.dracula_trail
+
+    @property
+    def dracula_location(self) -> int:
+        return self.dynamic.dracula_location
+
+    @dracula_location.setter
+    def dracula_location(self, location: int):
+        self.dynamic.dracula_location = int(location)
+
+    @property
+    def player_location(self) -> int:
+        return self.dynamic.player_location
+
+    @player_location.setter
+    def player_location(self, location: int):
+        self.dynamic.player_location = int(location)
+
+    @property
+    def trap_count(self) -> int:
+        return self.dynamic.trap_count
+
+    @trap_count.setter
+    def trap_count(self, count: int):
+        self.dynamic.trap_count = count
 
     def get_index(self, icao):
-        for i in range(len(self.airports)):
-            if icao == self.airports[i].ident:
-                return i
-        return -1
+        return self.world.get_index(icao)
+
+    def neighbour_trie(self, index: int) -> PrefixTrie[int]:
+        return self.world.neighbour_trie(index)
+
+    def snapshot(self) -> DynamicState:
+        """
+        :returns: A copy of the current turn, see `restore`
+        """
+        return self.dynamic.copy()
+
+    def restore(self, snapshot: DynamicState):
+        """
+        Return to a turn taken by `snapshot`. The snapshot stays untouched, so it may be
+        restored again.
+        """
+        self.dynamic = snapshot.copy()
+        self._replaced()
+
+    def clone(self) -> "GameState":
+        """
+        :returns: An independent game sharing the world of this one
+        """
+        return GameState(self.world, self.snapshot())
+
+    def push_undo(self):
+        """
+        Remember the current turn, see `undo`
+        """
+        self.undo_stack.append(self.snapshot())
+
+    def undo(self) -> bool:
+        """
+        Return to the turn remembered last by `push_undo`
+
+        :returns: False if there was nothing to undo
+        """
+        if not self.undo_stack:
+            return False
+        # nobody else holds the popped snapshot, no need to copy it
+        self.dynamic = self.undo_stack.pop()
+        self._replaced()
+        return True
+
+    @property
+    def change_count(self) -> int:
+        """
+        :returns: The amount of status changes since the epoch began, trimmed ones included
+        """
+        return self.changes_base + len(self.status_changes)
+
+    def changes_since(self, cursor: int) -> Optional[list[int]]:
+        """
+        :param cursor: A `change_count` read earlier in the same epoch
+        :returns: The airports whose status changed since, None if some of those changes were
+        trimmed already
+        """
+        if cursor < self.changes_base:
+            return None
+        return self.status_changes[cursor - self.changes_base :]
+
+    @property
+    def version(self) -> tuple:
+        """
+        :returns: A value which differs whenever the statuses or whereabouts changed, for
+        caches of what is drawn of the game
+        """
+        return self.epoch, self.change_count, self.player_location, self.dracula_location
+
+    def _replaced(self):
+        self.status_changes.clear()
+        self.changes_base = 0
+        self.epoch += 1
+
+    def set_status(self, index: int, status: AirportStatus):
+        """
+        Change the status of an airport, keeping the index sets in sync
+        """
+        index = int(index)
+        self.trapped.discard(index)
+        if status == AirportStatus.TRAPPED:
+            self.trapped.add(index)
+        elif status == AirportStatus.DESTROYED:
+            self.destroyed_airports.add(index)
+        self.status[index] = status
+        self.timer[index] = 0
+        self.status_changes.append(index)
+        if len(self.status_changes) > 2 * STATUS_CHANGES_KEPT:
+            # every consumer reads a few changes per turn, they are far behind these
+            trimmed = len(self.status_changes) - STATUS_CHANGES_KEPT
+            del self.status_changes[:trimmed]
+            self.changes_base += trimmed
+
+    def destroy(self, index: int):
+        self.set_status(index, AirportStatus.DESTROYED)
 
     def trap_location(self, index):
-        if (
-            self.states[index].status != AirportStatus.TRAPPED
-            and self.states[index].status != AirportStatus.DESTROYED
-        ):
-            self.states[index].status = AirportStatus.TRAPPED
-
-    def tick_trap_timer(self, character):
-        for state in self.states:
-            if state.status == AirportStatus.TRAPPED:
-                logger.info(
-                    f"Ticking trap for airport {state.airport.ident}, {state.timer} turns left"
+        if self.status[index] == AirportStatus.AVAILABLE:
+            self.set_status(index, AirportStatus.TRAPPED)
+
+    def tick_trap_timer(self):
+        """
+        Advance the timers of all traps, returning the expired ones to the player
+        """
+        if not self.trapped:
+            return
+        traps = np.fromiter(self.trapped, dtype=np.int64, count=len(self.trapped))
+        self.timer[traps] += 1
+        # the search ticks traps a lot, don't format messages nobody reads
+        if logger.isEnabledFor(INFO):
+            logger.info(
+                "Ticking traps "
+                + ", ".join(
+                    f"{self.airports[i].ident} ({TRAP_TIMEOUT_TURNS + 1 - self.timer[i]} turns left)"
+                    for i in traps
                 )
-                state.timer = state.timer + 1
-                if state.timer > 3:
-                    state.status = AirportStatus.AVAILABLE
-                    character.trap_count += 1
-                    state.timer = 0
+            )
+
+        released = traps[self.timer[traps] > TRAP_TIMEOUT_TURNS]
+        for index in released:
+            self.set_status(index, AirportStatus.AVAILABLE)
+        self.trap_count += len(released)
 
     def dracula_on_trap(self):
-        return self.states[self.dracula_location].status == AirportStatus.TRAPPED
+        return self.status[self.dracula_location] == AirportStatus.TRAPPED
 
     def is_dracula_near_trap(self) -> bool:
-        for vert in self.graph[self.dracula_location]:
-            if self.states[vert].status == AirportStatus.TRAPPED:
-                return True
-        return False
+        return bool(
+            np.any(self.status[self.graph[self.dracula_location]] == AirportStatus.TRAPPED)
+        )
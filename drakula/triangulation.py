@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from hashlib import blake2b
+
+import numpy as np
+
+from .graph import AirportGraph
+from .maths import geodesic_to_3d_pos, delaunay_triangulate_points
+from .models import AirportTable
+
+TRIANGULATION_CACHE_SIZE = 8
+
+
+def coordinates_key(airports: AirportTable) -> bytes:
+    """
+    :returns: A digest of the coordinates of the airports, equal only for equal coordinates
+    """
+    digest = blake2b(digest_size=16)
+    for column in (airports.latitude_deg, airports.longitude_deg, airports.elevation_ft):
+        digest.update(np.ascontiguousarray(column).data)
+    return digest.digest()
+
+
+def adjacency_from_triangles(triangles: np.ndarray, n: int) -> AirportGraph:
+    """
+    :param triangles: An (m, 3) array of vertex indices
+    :param n: The amount of vertices
+    :returns: The graph of the edges of the triangles
+    """
+    edges = triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2).astype(np.int64)
+    edges = np.concatenate([edges, edges[:, ::-1]])
+    # encoding each edge as a single integer makes deduplication a 1D unique, which also sorts
+    encoded = np.unique(edges[:, 0] * n + edges[:, 1])
+    sources, targets = np.divmod(encoded, n)
+    return AirportGraph.from_edges(sources, targets, n)
+
+
+class SphericalTriangulation:
+    """
+    Connects airports by triangulating them on the globe. Results are cached by the
+    coordinates of the airports, so repeated calls on an unchanged world are free.
+    """
+
+    def __init__(self, cache_size: int = TRIANGULATION_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: OrderedDict[bytes, AirportGraph] = OrderedDict()
+
+    def graph(self, airports: AirportTable) -> AirportGraph:
+        """
+        :returns: The connections between the airports
+        """
+        key = coordinates_key(airports)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        points = geodesic_to_3d_pos(
+            airports.latitude_deg, airports.longitude_deg, airports.elevation_ft
+        )
+        graph = adjacency_from_triangles(delaunay_triangulate_points(points), len(airports))
+
+        self._cache[key] = graph
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return graph
+
+
+_triangulation = SphericalTriangulation()
+
+
+def graph_from_airports(airports: AirportTable) -> AirportGraph:
+    """
+    :returns: The connections between the airports, see `SphericalTriangulation`
+    """
+    return _triangulation.graph(airports)
@@ -1,7 +1,8 @@
-import pygame
-import moderngl
 from collections.abc import Callable, Generator
-from typing import TypeVar, Optional, Tuple
+from typing import TypeVar, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import moderngl
 
 T = TypeVar("T")
 U = TypeVar("U")
@@ -45,7 +46,7 @@ def load_shader(shader_file):
 
 
 def load_texture(
-        ctx: moderngl.Context,
+        ctx: "moderngl.Context",
         texture_file: str,
         desired_size: Optional[Tuple[int, int]] = None,
 ):
@@ -55,6 +56,8 @@ def load_texture(
     :param desired_size: The size to scale the texture to. No up-scaling applied if `None`.
     :return: The scaled texture
     """
+    import pygame
+
     image = pygame.image.load(texture_file).convert_alpha()
     if desired_size:
         image = pygame.transform.scale(image, desired_size)
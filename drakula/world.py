@@ -0,0 +1,201 @@
+import os
+from typing import Optional, Union
+
+import numpy as np
+
+from .analytics import WorldAnalysis, ANALYTICS_MAX_AIRPORTS
+from .db import GameDatabaseFacade
+from .logging import logger
+from .models import AirportTable
+from .profiling import startup_profile
+from .snapshot import (
+    create_snapshot_facade,
+    SnapshotDatabaseFacade,
+    AIRPORT_STRING_COLUMNS,
+)
+from .dispersion import disperse_airports
+from .state import GameState, DynamicState
+
+AIRPORTS_PER_CONTINENT = 4
+
+# Chances of a player flying at random to win, as estimated by `WorldAnalysis`. Starts outside
+# are re-rolled, worlds without any start inside are generated anew. Worlds of 28 airports
+# average 0.245 to 0.261, so the bounds cut off the starts which are clearly easier or harder
+# than the usual game. Whole worlds are only rejected if they are outliers.
+WORLD_MIN_WIN_PROBABILITY = 0.23
+WORLD_MAX_WIN_PROBABILITY = 0.28
+WORLD_GENERATION_ATTEMPTS = 3
+
+
+class StartupProgress:
+    """
+    Progress of the world generation, written by the worker and read by the loading scene.
+    Plain attribute assignments, so no locking is needed.
+    """
+
+    def __init__(self):
+        self.stage = "Starting"
+        self.fraction = 0.0
+
+    def report(self, stage: str, fraction: float):
+        logger.debug(f"Startup: {stage} ({round(100 * fraction)}%)")
+        self.stage = stage
+        self.fraction = fraction
+
+
+def generate_world(
+    game: Optional[Union[GameDatabaseFacade, SnapshotDatabaseFacade]] = None,
+    seed: Optional[int] = None,
+    progress: Optional[StartupProgress] = None,
+) -> GameState:
+    """
+    Fetch, disperse and triangulate the airports of a new game. Touches neither pygame nor
+    OpenGL, so it can run on a worker thread while the window is being set up.
+
+    Starts which `WorldAnalysis` considers too easy or too hard are re-rolled. If no attempt
+    had a start within the bounds, the start closest to them of the best attempt is used.
+
+    :param game: Where to fetch the airports from, the snapshot facade if None
+    :param seed: Seed for picking the airports, see `debug.get_dev_seed`
+    :param progress: Receives the current stage of the generation
+    :returns: The state of the new game
+    """
+    progress = progress or StartupProgress()
+    with startup_profile.stage("database"):
+        progress.report("Connecting to the database", 0.0)
+        game = game or create_snapshot_facade()
+
+    # the attempt with the start closest to the bounds
+    best = None
+    for attempt in range(WORLD_GENERATION_ATTEMPTS):
+        attempt_seed = None if seed is None else seed + attempt
+        # every random choice comes from here, equal seeds generate equal games
+        rng = np.random.default_rng(attempt_seed)
+        state = _generate_world(game, attempt_seed, rng, progress)
+        if len(state.airports) > ANALYTICS_MAX_AIRPORTS:
+            best = None
+            break
+
+        progress.report("Balancing the world", 0.9)
+        with startup_profile.stage("world analysis"):
+            analysis = WorldAnalysis(state)
+            starts, distance = analysis.closest_starts(
+                WORLD_MIN_WIN_PROBABILITY, WORLD_MAX_WIN_PROBABILITY
+            )
+        if best is None or distance < best[0]:
+            best = (distance, state, analysis, starts, rng)
+        if distance == 0:
+            break
+        logger.info(
+            f"Rejected a world, {analysis.world_difficulty().win_probability:.2f} chance of winning"
+        )
+    else:
+        logger.warning(
+            f"No world had a start with a chance of winning from {WORLD_MIN_WIN_PROBABILITY} "
+            f"to {WORLD_MAX_WIN_PROBABILITY} in {WORLD_GENERATION_ATTEMPTS} attempts, "
+            f"using one {best[0]:.2f} off"
+        )
+
+    if best is not None:
+        state = _balance_start(*best[1:])
+    progress.report("Ready", 1.0)
+    return state
+
+
+def _balance_start(
+    state: GameState, analysis: WorldAnalysis, starts: np.ndarray, rng: np.random.Generator
+) -> GameState:
+    """
+    :param starts: The pairs of Dracula and player airports to pick from, see
+    `WorldAnalysis.closest_starts`
+    :returns: `state` if it starts at one of `starts`, a fresh game at a random one otherwise
+    """
+    start = (state.dracula_location, state.player_location)
+    if np.any(np.all(starts == start, axis=1)):
+        return state
+    dracula_location, player_location = rng.choice(starts)
+    logger.info(
+        f"Re-rolled the start, the chance of winning was {analysis.win_probability[start]:.2f}"
+    )
+    return GameState(
+        state.world,
+        DynamicState(len(state.world), int(player_location), int(dracula_location)),
+    )
+
+
+def _generate_world(
+    game: Union[GameDatabaseFacade, SnapshotDatabaseFacade],
+    seed: Optional[int],
+    rng: np.random.Generator,
+    progress: StartupProgress,
+) -> GameState:
+    with startup_profile.stage("database"):
+        progress.report("Fetching airports", 0.2)
+        airports = AirportTable.from_airports(
+            game.fetch_random_airports_per_continent(AIRPORTS_PER_CONTINENT, seed=seed)
+        )
+    if game.db is not None:
+        game.db.stats.report()
+
+    with startup_profile.stage("world generation"):
+        logger.info("Dispersing airports...")
+        steps = disperse_airports(
+            airports,
+            on_step=lambda step, max_steps: progress.report(
+                "Dispersing airports", 0.4 + 0.4 * step / max_steps
+            ),
+        )
+        logger.info(f"Airport dispersion done after {steps} steps!")
+
+        progress.report("Building flight routes", 0.8)
+        player_location = int(rng.integers(len(airports)))
+        return GameState.new_game(airports, player_location, rng)
+
+
+def load_or_generate_world(
+    savegame: Optional[str],
+    game: Optional[Union[GameDatabaseFacade, SnapshotDatabaseFacade]] = None,
+    seed: Optional[int] = None,
+    progress: Optional[StartupProgress] = None,
+) -> GameState:
+    """
+    Resume the game saved in `savegame` if there is a usable one, see `generate_world` otherwise
+    """
+    from .savegame import load_game
+
+    if savegame and os.path.exists(savegame):
+        progress = progress or StartupProgress()
+        progress.report("Loading the saved game", 0.0)
+        try:
+            with startup_profile.stage("savegame"):
+                state = load_game(savegame)
+            progress.report("Ready", 1.0)
+            return state
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not resume the game from {savegame} ({e}), starting anew")
+    return generate_world(game, seed, progress)
+
+
+def synthetic_world(n: int, seed: Optional[int] = None) -> GameState:
+    """
+    A world of `n` airports spread uniformly over the globe, without touching the database and
+    without dispersion. Meant for benchmarks.
+    """
+    rng = np.random.default_rng(seed)
+    idents = [f"S{i:06d}" for i in range(n)]
+    strings = {name: [""] * n for name in AIRPORT_STRING_COLUMNS}
+    strings.update(
+        ident=idents,
+        name=[f"Synthetic airport {ident}" for ident in idents],
+        type=["small_airport"] * n,
+        continent=["EU"] * n,
+        iso_country=["XX"] * n,
+    )
+    airports = AirportTable(
+        np.arange(1, n + 1),
+        np.degrees(np.arcsin(rng.uniform(-1, 1, n))),
+        rng.uniform(-180, 180, n),
+        np.zeros(n),
+        strings,
+    )
+    return GameState.new_game(airports, int(rng.integers(n)), rng)